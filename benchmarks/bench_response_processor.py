@@ -0,0 +1,137 @@
+# benchmarks/bench_response_processor.py
+#
+# Micro-benchmark for the response post-processor. Checks that
+# trim_incomplete_response matches the original inline implementation on a
+# corpus of fixtures, then times both on long truncated replies.
+#
+# Usage: python -m benchmarks.bench_response_processor
+
+import random
+import timeit
+from services.response_processor import trim_incomplete_response
+
+def legacy_trim(ai_response, finish_reason):
+    """The original trimming logic from AIClient.chat_with_model, kept as a reference"""
+    if finish_reason != "stop":
+        abbreviations = {
+            'mr.', 'mrs.', 'ms.', 'dr.', 'prof.', 'sr.', 'jr.',
+            'vs.', 'etc.', 'e.g.', 'i.e.',
+            'inc.', 'ltd.', 'corp.', 'llc.', 'co.'
+        }
+        sentences = []
+        last_end = 0
+        for i, char in enumerate(ai_response):
+            if char in '.!?':
+                word_start = max(0, ai_response.rfind(' ', 0, i) + 1)
+                word_with_period = ai_response[word_start:i+1].lower()
+                is_sentence_end = True
+                if word_with_period in abbreviations:
+                    is_sentence_end = False
+                elif i > 0 and i < len(ai_response) - 1:
+                    if ai_response[i-1].isdigit() and ai_response[i+1].isdigit():
+                        is_sentence_end = False
+                elif i < len(ai_response) - 1 and not ai_response[i+1].isspace():
+                    is_sentence_end = False
+                if is_sentence_end:
+                    sentence = ai_response[last_end:i+1].strip()
+                    if sentence:
+                        sentences.append(sentence)
+                        last_end = i + 1
+        remaining = ai_response[last_end:].strip()
+        if remaining:
+            sentences.append(remaining)
+        incomplete_endings = [
+            'and', 'but', 'or', 'nor', 'for', 'yet', 'so',
+            'with', 'to', 'in', 'at', 'by',
+            ',', ', and', ', or'
+        ]
+        if sentences:
+            ai_response = ' '.join(sentences)
+            last_words = ai_response.rstrip().lower().split()
+            ends_with_incomplete = (
+                not any(ai_response.rstrip().endswith(char) for char in '.!?') or
+                (last_words and any(last_words[-1].endswith(ending) for ending in incomplete_endings))
+            )
+            if '.' in ai_response and not ai_response.endswith('.'):
+                last_period = ai_response.rindex('.')
+                if last_period > len(ai_response) * 0.75:
+                    ai_response = ai_response[:last_period + 1]
+            if ends_with_incomplete:
+                last_complete = -1
+                for i, char in enumerate(ai_response):
+                    if char in '.!?':
+                        text_after = ai_response[i+1:].strip()
+                        words_after = text_after.lower().split()
+                        if not words_after or words_after[0] not in incomplete_endings:
+                            last_complete = i
+                if last_complete != -1:
+                    ai_response = ai_response[:last_complete + 1].strip()
+    return ai_response
+
+FIXTURES = [
+    "Hello there. How are you doing today? I was thinking that we could",
+    "She smiled at Mr. Smith and said hi. Then she left and",
+    "The value of pi is 3.14 and e is 2.71. Both are irrational, but",
+    "Wow! That's amazing! Tell me more about",
+    "It costs $5.99.And then some.",
+    ".Leading dot then text",
+    "Ends cleanly.",
+    "No punctuation at all here",
+    "Several sentences. And then. Another one, and",
+    "Trailing comma,",
+    "We went to the store, e.g. the big one. It was closed so",
+    "Dr. Who? I don't know. Ask Prof. X etc. and",
+    "Line one.\n\nLine two!\nLine three?  Spaces   everywhere and",
+    "A long sentence that goes on. Followed by a short one. x",
+    "Questions?! Exclamations!? Mixed... ellipses... and",
+    "Numbers like 1.2.3 and v2.0. Done. But",
+    "ONE. AND. TWO. OR",
+    "",
+    "   ",
+    "...",
+    "a.b.c.d.e",
+]
+
+def random_fixtures(count, seed=1234):
+    rng = random.Random(seed)
+    words = ['the', 'and', 'Mr.', 'e.g.', '3.14', 'cat', 'so', 'to', 'Hello', ',', 'etc.', 'or', 'x!', 'why?', 'ok.']
+    separators = [' ', ' ', ' ', '\n', '  ', '. ', '! ', '? ', '.', ', ']
+    fixtures = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 60)):
+            parts.append(rng.choice(words))
+            parts.append(rng.choice(separators))
+        fixtures.append(''.join(parts).strip())
+    return fixtures
+
+def long_response(sentences):
+    base = "The quick brown fox jumps over the lazy dog, and Dr. Jones measured 3.14 meters. "
+    return (base * sentences) + "But then it trailed off and"
+
+def check_parity():
+    corpus = FIXTURES + random_fixtures(2000) + [long_response(50)]
+    for text in corpus:
+        for finish_reason in ("length", "stop", None):
+            expected = legacy_trim(text, finish_reason)
+            actual = trim_incomplete_response(text, finish_reason)
+            assert actual == expected, f"Mismatch for {text!r}: {actual!r} != {expected!r}"
+    print(f"Parity OK on {len(corpus)} fixtures")
+
+def run_benchmark():
+    cases = [
+        ("max_tokens=200", long_response(10)),
+        ("max_tokens=2000", long_response(100)),
+        ("max_tokens=8000", long_response(400)),
+        ("no spaces", "x." * 4000 + " and"),
+    ]
+    for label, text in cases:
+        number = 20
+        legacy = timeit.timeit(lambda: legacy_trim(text, "length"), number=number) / number
+        current = timeit.timeit(lambda: trim_incomplete_response(text, "length"), number=number) / number
+        print(f"{label:>16} ({len(text):>6} chars): legacy {legacy * 1000:8.2f} ms, "
+              f"current {current * 1000:8.2f} ms, {legacy / current:6.1f}x")
+
+if __name__ == "__main__":
+    check_parity()
+    run_benchmark()
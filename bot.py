@@ -1,11 +1,14 @@
+import asyncio
 import discord
 from discord.ext import commands
 from config.settings import DISCORD_TOKEN, API_KEY, ALLOWED_CHANNEL_IDS
 from utils.logger import setup_logger
+from utils.background_writer import background_writer
 from services.ai_client import AIClient
 from services.conversation_manager import ConversationManager
+from services.preset_registry import PresetRegistry
 from cogs.commands import BotCommands
-from cogs.events import BotEvents
+from cogs.events import BotEvents, ReplyControl
 
 class MancerMate(commands.Bot):
     def __init__(self):
@@ -19,6 +22,7 @@ class MancerMate(commands.Bot):
         # Initialize services
         self.ai_client = AIClient()
         self.conversation_manager = ConversationManager()
+        self.presets = PresetRegistry(self.conversation_manager.parameters)
         
         # Set up logger
         self.logger = setup_logger()
@@ -35,8 +39,14 @@ class MancerMate(commands.Bot):
     async def setup_hook(self):
         """Initialize async components and load cogs"""
         await self.ai_client.initialize()
+        await self.ai_client.prewarm()
+        self.conversation_manager.start_persistence()
+        await self.presets.start()
         await self.add_cog(BotCommands(self))
         await self.add_cog(BotEvents(self))
+
+        # Route reply button clicks by custom_id, including buttons sent before a restart
+        self.add_dynamic_items(ReplyControl)
         
         try:
             synced = await self.tree.sync()
@@ -54,8 +64,13 @@ class MancerMate(commands.Bot):
     async def close(self):
         """Clean up resources when shutting down"""
         await self.ai_client.close()
+        await self.presets.close()
+        await self.conversation_manager.close()
         await super().close()
 
+        # Write out queued chat logs and log records
+        await asyncio.to_thread(background_writer.close)
+
 def main():
     # Validate required environment variables
     if not API_KEY or not DISCORD_TOKEN:
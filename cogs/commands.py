@@ -1,5 +1,6 @@
 # cogs/commands.py
 
+import asyncio
 import json
 import os
 import discord
@@ -7,7 +8,12 @@ from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View
 import logging
-from config.settings import CHAT_LOGS_DIR, TEXTGEN_DIR, DEFAULT_AI_PARAMS, AVAILABLE_MODELS
+from utils.background_writer import background_writer
+from cogs.events import request_priority, send_paginated
+from services.response_processor import paginate
+from services.preset_registry import PresetError
+from services.ai_client import ErrorReply
+from config.settings import CHAT_LOGS_DIR, AVAILABLE_MODELS
 import datetime
 
 logger = logging.getLogger('discord')
@@ -34,25 +40,21 @@ class BotCommands(commands.Cog):
     @is_in_allowed_channel()
     async def slash_load_params(self, interaction: discord.Interaction, file_name: str, public: bool = False):
         try:
-            file_path = os.path.join(TEXTGEN_DIR, file_name)
-            with open(file_path, 'r', encoding='utf-8') as file:
-                new_params = json.load(file)
+            # Presets are validated when loaded from disk, so switching is a lookup
+            new_params = self.bot.presets.get(file_name).params
 
-            global DEFAULT_AI_PARAMS
-            DEFAULT_AI_PARAMS.update(new_params)
+            # Switch every user to the new preset at once
+            preset = self.bot.conversation_manager.parameters.set_preset(new_params, file_name)
 
-            response = f"Parameters successfully loaded from {file_name}."
+            response = f"Parameters successfully loaded from {file_name} (preset version {preset.version})."
 
             # Update the current_token_limit if the model has changed
             if "model" in new_params and new_params["model"] in AVAILABLE_MODELS:
                 self.bot.conversation_manager.current_token_limit = AVAILABLE_MODELS[new_params["model"]]
                 response += f"\nToken limit updated to {self.bot.conversation_manager.current_token_limit} for model {new_params['model']}."
 
-        except FileNotFoundError:
-            response = f"Error: File '{file_name}' not found in the {TEXTGEN_DIR} directory."
-            logger.error(response, extra={'user_id': interaction.user.id, 'command': 'load_params'})
-        except json.JSONDecodeError:
-            response = f"Error: '{file_name}' is not a valid JSON file."
+        except PresetError as e:
+            response = f"Error: {str(e)}"
             logger.error(response, extra={'user_id': interaction.user.id, 'command': 'load_params'})
         except Exception as e:
             response = f"An error occurred: {str(e)}"
@@ -60,12 +62,53 @@ class BotCommands(commands.Cog):
 
         await interaction.response.send_message(response, ephemeral=not public)
 
+    @slash_load_params.autocomplete('file_name')
+    async def load_params_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=name, value=name) for name in self.bot.presets.search(current)]
+
+    @app_commands.command(name="set_persona", description="Choose the persona the bot uses in this channel or server")
+    @app_commands.describe(
+        persona="Name of the persona file in the preloads directory, without the extension",
+        scope="Apply to this channel only or to the whole server",
+        public="Make the response visible to everyone"
+    )
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="This channel", value="channel"),
+        app_commands.Choice(name="Whole server", value="guild"),
+    ])
+    @app_commands.checks.has_permissions(administrator=True)
+    @is_in_allowed_channel()
+    async def slash_set_persona(self, interaction: discord.Interaction, persona: str, scope: str = "channel", public: bool = False):
+        scope_id = interaction.guild_id if scope == "guild" else interaction.channel_id
+        if scope_id is None:
+            response = "Error: Server personas can only be set from a server channel."
+        else:
+            try:
+                # Conversations switch to the persona with their next message
+                await self.bot.conversation_manager.assign_persona(scope, scope_id, persona)
+                where = "this server" if scope == "guild" else "this channel"
+                response = f"Persona '{persona}' will be used in {where}."
+                logger.info(response, extra={'user_id': interaction.user.id, 'command': 'set_persona'})
+            except KeyError:
+                response = f"Error: Persona '{persona}' not found in the preloads directory."
+                logger.error(response, extra={'user_id': interaction.user.id, 'command': 'set_persona'})
+
+        await interaction.response.send_message(response, ephemeral=not public)
+
+    @slash_set_persona.autocomplete('persona')
+    async def set_persona_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [
+            app_commands.Choice(name=persona_id, value=persona_id)
+            for persona_id in self.bot.conversation_manager.personas.search(current)
+        ]
+
     @app_commands.command(name="clear_history", description="Clear your conversation history with the bot")
     @is_in_allowed_channel()
     async def slash_clear_history(self, interaction: discord.Interaction):
         try:
             await interaction.response.defer(ephemeral=True)
             user_id = interaction.user.id
+            self.bot.ai_client.cancel_generation(user_id)
             self.bot.conversation_manager.clear_history(user_id)
             response = f"{interaction.user.name}, your conversation history has been cleared."
             await interaction.followup.send(response, ephemeral=True)
@@ -80,11 +123,33 @@ class BotCommands(commands.Cog):
     @app_commands.describe(public="Make the response visible to everyone")
     @is_in_allowed_channel()
     async def slash_get_params(self, interaction: discord.Interaction, public: bool = False):
-        params_str = "\n".join([f"{k}: {v}" for k, v in DEFAULT_AI_PARAMS.items()])
-        response = f"Current parameters:\n```\n{params_str}\n```"
+        preset = self.bot.conversation_manager.parameters.preset
+        params_str = "\n".join([f"{k}: {v}" for k, v in preset.params.items()])
+        response = f"Current parameters ({preset.name}, version {preset.version}):\n```\n{params_str}\n```"
         await interaction.response.send_message(response, ephemeral=not public)
         logger.info("Displayed AI parameters.", extra={'user_id': interaction.user.id, 'command': 'get_params'})
 
+    @app_commands.command(name="stats", description="Show request and conversation statistics")
+    @app_commands.describe(public="Make the response visible to everyone")
+    @app_commands.checks.has_permissions(administrator=True)
+    @is_in_allowed_channel()
+    async def slash_stats(self, interaction: discord.Interaction, public: bool = False):
+        metrics = {
+            **self.bot.ai_client.get_metrics(),
+            **self.bot.conversation_manager.get_metrics(),
+            "writer": background_writer.get_metrics(),
+            "presets": self.bot.presets.get_metrics(),
+        }
+        events = self.bot.get_cog("BotEvents")
+        if events is not None:
+            metrics["debounce"] = events.debouncer.get_metrics()
+        stats_str = "\n".join(
+            f"{section}.{k}: {v}" for section, values in metrics.items() for k, v in values.items()
+        )
+        response = f"Current statistics:\n```\n{stats_str}\n```"
+        await interaction.response.send_message(response, ephemeral=not public)
+        logger.info("Displayed statistics.", extra={'user_id': interaction.user.id, 'command': 'stats'})
+
     @app_commands.command(name="help", description="List available commands")
     @is_in_allowed_channel()
     async def slash_help(self, interaction: discord.Interaction):
@@ -94,6 +159,8 @@ class BotCommands(commands.Cog):
 - `/get_params`: Get current AI parameters.
 - `/continue`: Continue the last response.
 - `/load_params`: Load AI parameters from a file (Admin only).
+- `/set_persona`: Choose the persona for this channel or server (Admin only).
+- `/stats`: Show request and conversation statistics (Admin only).
 - `/help`: Show this help message.
 
 **How to Interact with the Bot:**
@@ -111,24 +178,29 @@ class BotCommands(commands.Cog):
         
         if last_response:
             await interaction.response.defer()
-            continuation_prompt = "Please continue from where you left off, but finish quickly."
             continuation = await self.bot.ai_client.chat_with_model(
                 user_id, 
-                continuation_prompt, 
+                None, 
                 self.bot.conversation_manager,
                 username=interaction.user.name,
+                priority=request_priority(interaction.user, interaction.channel),
+                continue_last=True,
             )
             
-            if isinstance(continuation, str):
-                # Truncate response if needed
-                if len(continuation) > 1900:
-                    continuation = continuation[:1900] + "..."
-                
-                await interaction.followup.send(continuation)
-                logger.info("Continued last response.", extra={'user_id': user_id, 'command': 'continue'})
-            else:
-                # If continuation is not a string, it's likely an error message
+            if continuation is None:
+                # Superseded by a newer message
+                return
+
+            if isinstance(continuation, ErrorReply):
                 await interaction.followup.send(continuation, ephemeral=True)
+            else:
+                # Split long continuations at sentence boundaries instead of truncating
+                new_messages = await send_paginated(interaction.followup.send, paginate(continuation))
+                conversation_manager = self.bot.conversation_manager
+                conversation_manager.save_response_messages(
+                    user_id, conversation_manager.get_response_messages(user_id) + [message.id for message in new_messages]
+                )
+                logger.info("Continued last response.", extra={'user_id': user_id, 'command': 'continue'})
         else:
             await interaction.response.send_message("There's no previous response to continue from.", ephemeral=True)
 
@@ -150,7 +222,7 @@ class BotCommands(commands.Cog):
 
             # Format the history for display
             formatted_history = "**Conversation History:**\n```json\n"
-            for msg in history:
+            for msg in history.full_messages():
                 role = msg['role']
                 content = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
                 formatted_history += f"{role}: {content}\n"
@@ -162,8 +234,9 @@ class BotCommands(commands.Cog):
                 filename = f"history_{user_id}_{timestamp}.json"
                 file_path = os.path.join(CHAT_LOGS_DIR, filename)
                 
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(history, f, indent=2, ensure_ascii=False)
+                await asyncio.wrap_future(background_writer.write(
+                    file_path, json.dumps(history.full_messages(), indent=2, ensure_ascii=False), mode='w'
+                ))
                 
                 # Create Discord file attachment
                 discord_file = discord.File(file_path, filename=filename)
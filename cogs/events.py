@@ -1,14 +1,87 @@
 # cogs/events.py
 
+import asyncio
+import functools
+import time
 import discord
 from discord.ext import commands
 from discord.ui import View, Button, Select
 import logging
+from config.settings import STREAM_RESPONSES, STREAM_EDIT_INTERVAL, MESSAGE_DEBOUNCE_WINDOW, MESSAGE_DEBOUNCE_MAX_WAIT
+from utils.debouncer import Debouncer
+from services.response_processor import paginate
+from services.ai_client import ErrorReply
 
 logger = logging.getLogger('discord')
 
+def request_priority(user, channel, reroll=False):
+    """Scheduling class for a generation requested by ``user`` in ``channel``"""
+    permissions = getattr(user, 'guild_permissions', None)
+    if permissions is not None and permissions.administrator:
+        return "admin"
+    if reroll:
+        return "reroll"
+    if isinstance(channel, discord.DMChannel):
+        return "dm"
+    return "channel"
+
+async def edit_in_place(channel, message_id, content, view=None):
+    """Edit a bot reply through a partial message, without fetching it first.
+
+    Returns False if the message is unknown or the edit failed, so the caller
+    can fall back to sending a new message.
+    """
+    if message_id is None:
+        return False
+    try:
+        await channel.get_partial_message(message_id).edit(content=content, view=view)
+        return True
+    except discord.HTTPException as e:
+        logger.warning(f"Failed to edit reply in place: {str(e)}", 
+                      extra={'user_id': 'N/A', 'command': 'edit_in_place'})
+        return False
+
+async def send_paginated(send, chunks, view=None):
+    """Send ``chunks`` one message each through ``send``, with ``view`` on the last only.
+
+    Returns the messages sent, in order; the last one carries the reply buttons.
+    """
+    messages = []
+    for index, chunk in enumerate(chunks):
+        if view is not None and index == len(chunks) - 1:
+            messages.append(await send(chunk, view=view))
+        else:
+            messages.append(await send(chunk))
+    return messages
+
+async def replace_reply(channel, message_ids, chunks, view=None):
+    """Show ``chunks`` in place of the reply split across ``message_ids``, with ``view`` on the last chunk.
+
+    The old messages are edited in order. Chunks left over, or every chunk after an
+    edit fails, are sent as new messages, and old messages no longer used are
+    deleted. Returns the ids of the messages now holding the reply.
+    """
+    new_ids = []
+    for message_id, chunk in zip(message_ids, chunks):
+        chunk_view = view if len(new_ids) == len(chunks) - 1 else None
+        if not await edit_in_place(channel, message_id, chunk, view=chunk_view):
+            break
+        new_ids.append(message_id)
+    for message in await send_paginated(channel.send, chunks[len(new_ids):], view=view):
+        new_ids.append(message.id)
+
+    for message_id in message_ids:
+        if message_id not in new_ids:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to delete old reply: {str(e)}", 
+                              extra={'user_id': 'N/A', 'command': 'replace_reply'})
+    return new_ids
+
 class TemperatureSelect(Select):
     def __init__(self, user_id, original_message):
+        # Keep in step with REROLL_TEMPERATURES in services/ai_client.py
         options = [
             discord.SelectOption(
                 label="Low Creativity (0.7)",
@@ -50,43 +123,36 @@ class TemperatureSelect(Select):
 
         # Get necessary managers
         conversation_manager = interaction.client.conversation_manager
-        response_message_id = conversation_manager.get_response_message_id(self.user_id)
-
-        # Get the channel and message to be replaced
+        response_message_ids = conversation_manager.get_response_messages(self.user_id)
         channel = interaction.channel
-        try:
-            ai_message = await channel.fetch_message(response_message_id)
-        except discord.NotFound:
-            await interaction.followup.send("Original message not found.", ephemeral=True)
-            return
-
-        # Show typing indicator while generating response
-        async with channel.typing():
-            # Generate new response with custom temperature
-            ai_client = interaction.client.ai_client
-            new_response = await ai_client.chat_with_model(
-                self.user_id,
-                self.original_message,
-                conversation_manager,
-                username=interaction.user.name,
-                reroll=True,
-                temperature=temperature
-            )
 
-        if isinstance(new_response, str):
-            # Delete old message and send new one
-            await ai_message.delete()
-            
-            view = View()
-            view.add_item(ReRollButton(user_id=self.user_id))
-            view.add_item(ContinueButton(user_id=self.user_id))
-            view.add_item(ClearHistoryButton(user_id=self.user_id))
-
-            new_message = await channel.send(
-                new_response.encode('utf-8', errors='ignore').decode('utf-8'),
-                view=view
-            )
-            conversation_manager.save_response_message_id(self.user_id, new_message.id)
+        # Serve the re-roll from the prefetch buffer when a candidate is available
+        ai_client = interaction.client.ai_client
+        new_response = await ai_client.serve_prefetched_reroll(self.user_id, conversation_manager, temperature)
+        if new_response is None:
+            # Show typing indicator while generating response
+            async with channel.typing():
+                # Generate new response with custom temperature
+                new_response = await ai_client.chat_with_model(
+                    self.user_id,
+                    self.original_message,
+                    conversation_manager,
+                    username=interaction.user.name,
+                    reroll=True,
+                    priority=request_priority(interaction.user, channel, reroll=True),
+                    temperature=temperature
+                )
+
+        if isinstance(new_response, ErrorReply):
+            # The previous reply is still in place
+            await interaction.followup.send(new_response, ephemeral=True)
+        elif isinstance(new_response, str):
+            view = reply_controls(self.user_id)
+
+            # Replace the old reply chunk by chunk, starting from its first message
+            chunks = paginate(new_response.encode('utf-8', errors='ignore').decode('utf-8'))
+            message_ids = await replace_reply(channel, response_message_ids, chunks, view=view)
+            conversation_manager.save_response_messages(self.user_id, message_ids)
             conversation_manager.update_last_response(self.user_id, new_response)
 
             await interaction.followup.send(
@@ -99,21 +165,42 @@ class TemperatureView(View):
         super().__init__()
         self.add_item(TemperatureSelect(user_id, original_message))
 
-class ReRollButton(Button):
-    def __init__(self, user_id):
-        super().__init__(
-            label="Re-roll", 
-            style=discord.ButtonStyle.secondary,
-            emoji="🎲",
-            custom_id=f"reroll_{user_id}"
-        )
+class ReplyControl(discord.ui.DynamicItem[Button], template=r'(?P<action>reroll|continue|clear)_(?P<user_id>[0-9]+)'):
+    """The Re-roll, Continue and Clear buttons under every reply.
+
+    The action and the user are encoded in the ``custom_id``, so one persistent
+    handler registered in ``setup_hook`` routes every click, including clicks on
+    replies sent before a restart, without keeping an object per message.
+    """
+    BUTTONS = {
+        "reroll": ("Re-roll", discord.ButtonStyle.secondary, "🎲"),
+        "continue": ("Continue", discord.ButtonStyle.success, "➡️"),
+        "clear": ("Clear", discord.ButtonStyle.secondary, "🗑️"),
+    }
+
+    def __init__(self, action, user_id):
+        label, style, emoji = self.BUTTONS[action]
+        super().__init__(Button(label=label, style=style, emoji=emoji, custom_id=f"{action}_{user_id}"))
+        self.action = action
         self.user_id = user_id
 
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match):
+        return cls(match['action'], int(match['user_id']))
+
     async def callback(self, interaction: discord.Interaction):
         if interaction.user.id != self.user_id:
             await interaction.response.send_message("You cannot use this button.", ephemeral=True)
             return
 
+        if self.action == "reroll":
+            await self.reroll(interaction)
+        elif self.action == "continue":
+            await self.continue_response(interaction)
+        else:
+            await self.clear(interaction)
+
+    async def reroll(self, interaction: discord.Interaction):
         # Get the original message
         conversation_manager = interaction.client.conversation_manager
         original_message = conversation_manager.get_original_message(self.user_id)
@@ -126,21 +213,7 @@ class ReRollButton(Button):
             ephemeral=True
         )
 
-class ContinueButton(Button):
-    def __init__(self, user_id):
-        super().__init__(
-            label="Continue", 
-            style=discord.ButtonStyle.success,
-            emoji="➡️",
-            custom_id=f"continue_{user_id}"
-        )
-        self.user_id = user_id
-
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("You cannot use this button.", ephemeral=True)
-            return
-
+    async def continue_response(self, interaction: discord.Interaction):
         await interaction.response.defer()
         
         # Get last response
@@ -153,45 +226,41 @@ class ContinueButton(Button):
 
         # Add typing indicator
         async with interaction.channel.typing():
-            # Generate continuation
+            # Extend the last reply; the history is updated in place
             continuation = await interaction.client.ai_client.chat_with_model(
                 self.user_id,
-                "Please continue from where you left off, but finish quickly.",
+                None,
                 conversation_manager,
-                username=interaction.user.name
+                username=interaction.user.name,
+                priority=request_priority(interaction.user, interaction.channel),
+                continue_last=True
             )
 
-            if isinstance(continuation, str):
-                # Create view with buttons
-                view = View()
-                view.add_item(ReRollButton(user_id=self.user_id))
-                view.add_item(ContinueButton(user_id=self.user_id))
-                view.add_item(ClearHistoryButton(user_id=self.user_id))
-                
-                # Update conversation history with the continuation
-                conversation_manager.update_last_response(self.user_id, last_response + "\n\n" + continuation)
-                
-                await interaction.followup.send(continuation, view=view)
+            if continuation is None:
+                # Superseded by a newer message
+                return
+
+            if isinstance(continuation, ErrorReply):
+                await interaction.followup.send(continuation, ephemeral=True)
+            elif isinstance(continuation, str):
+                view = reply_controls(self.user_id)
+                combined_response = conversation_manager.get_last_response(self.user_id)
+
+                # Append the continuation to the previous reply in place while it fits in one message
+                response_message_ids = conversation_manager.get_response_messages(self.user_id)
+                if len(combined_response) > 1900 or not await edit_in_place(
+                    interaction.channel, response_message_ids[-1] if response_message_ids else None,
+                    combined_response, view=view
+                ):
+                    # The continuation becomes part of the reply that a re-roll replaces
+                    new_messages = await send_paginated(interaction.followup.send, paginate(continuation), view=view)
+                    conversation_manager.save_response_messages(
+                        self.user_id, response_message_ids + [new_message.id for new_message in new_messages]
+                    )
                 logger.info("Continued response via button.", 
                            extra={'user_id': self.user_id, 'command': 'continue_button'})
-            else:
-                await interaction.followup.send(continuation, ephemeral=True)
-
-class ClearHistoryButton(Button):
-    def __init__(self, user_id):
-        super().__init__(
-            label="Clear", 
-            style=discord.ButtonStyle.secondary,
-            emoji="🗑️",
-            custom_id=f"clear_{user_id}"
-        )
-        self.user_id = user_id
-
-    async def callback(self, interaction: discord.Interaction):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("You cannot use this button.", ephemeral=True)
-            return
 
+    async def clear(self, interaction: discord.Interaction):
         # Create confirmation view
         view = ConfirmClearView(self.user_id)
         await interaction.response.send_message(
@@ -200,6 +269,19 @@ class ClearHistoryButton(Button):
             ephemeral=True
         )
 
+@functools.lru_cache(maxsize=1024)
+def reply_controls(user_id):
+    """Shared view with the reply buttons for ``user_id``.
+
+    The view is stopped up front so discord.py only serializes it and never tracks
+    it per message; clicks are handled by the registered ``ReplyControl`` item.
+    """
+    view = View(timeout=None)
+    for action in ReplyControl.BUTTONS:
+        view.add_item(ReplyControl(action, user_id))
+    view.stop()
+    return view
+
 class ConfirmClearView(View):
     def __init__(self, user_id):
         super().__init__()
@@ -212,6 +294,7 @@ class ConfirmClearView(View):
             return
 
         conversation_manager = interaction.client.conversation_manager
+        interaction.client.ai_client.cancel_generation(self.user_id)
         conversation_manager.clear_history(self.user_id)
         
         # Disable the buttons after use
@@ -240,9 +323,79 @@ class ConfirmClearView(View):
             view=self
         )
 
+class StreamingReply:
+    """Progressively edits a reply to ``message`` while a response is streamed.
+
+    The reply is posted when the first tokens arrive and is then edited at most
+    once every ``STREAM_EDIT_INTERVAL`` seconds to stay within Discord's rate limits.
+    """
+    def __init__(self, message, max_length=1900):
+        self.message = message
+        self.max_length = max_length
+        self.reply = None
+        self.text = ""
+        self.shown_text = ""
+        self.last_edit = 0.0
+        self.edit_task = None
+
+    def _render(self, text):
+        if len(text) > self.max_length:
+            text = text[:self.max_length] + "..."
+        return text.encode('utf-8', errors='ignore').decode('utf-8')
+
+    async def update(self, text):
+        """Record the text received so far and schedule an edit if one is due"""
+        self.text = text
+        if self.reply is None:
+            self.shown_text = text
+            self.last_edit = time.monotonic()
+            self.reply = await self.message.reply(self._render(text) + " …")
+        elif self.edit_task is None or self.edit_task.done():
+            self.edit_task = asyncio.create_task(self._edit_when_due())
+
+    async def _edit_when_due(self):
+        delay = self.last_edit + STREAM_EDIT_INTERVAL - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.text == self.shown_text:
+            return
+        self.shown_text = self.text
+        self.last_edit = time.monotonic()
+        try:
+            await self.reply.edit(content=self._render(self.text) + " …")
+        except discord.HTTPException as e:
+            logger.warning(f"Failed to edit streaming reply: {str(e)}", 
+                          extra={'user_id': self.message.author.id, 'command': 'stream_reply'})
+
+    async def discard(self):
+        """Stop progressive edits and delete the partial reply"""
+        if self.edit_task is not None and not self.edit_task.done():
+            self.edit_task.cancel()
+        if self.reply is not None:
+            try:
+                await self.reply.delete()
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to delete streaming reply: {str(e)}", 
+                              extra={'user_id': self.message.author.id, 'command': 'stream_reply'})
+            self.reply = None
+
+    async def finish(self, content, view=None):
+        """Stop progressive edits and show the final content, returning the reply message"""
+        if self.edit_task is not None and not self.edit_task.done():
+            self.edit_task.cancel()
+        if self.reply is None:
+            return await self.message.reply(content, view=view)
+        await self.reply.edit(content=content, view=view)
+        return self.reply
+
 class BotEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Messages a user sends in quick succession are answered together
+        self.debouncer = Debouncer(MESSAGE_DEBOUNCE_WINDOW, self.respond_to_burst, MESSAGE_DEBOUNCE_MAX_WAIT)
+
+    async def cog_unload(self):
+        self.debouncer.close()
 
     def is_allowed_channel(self, channel_id: int) -> bool:
         from config.settings import ALLOWED_CHANNEL_IDS
@@ -271,38 +424,80 @@ class BotEvents(commands.Cog):
                     processed_content = processed_content.replace(f'<@{mention.id}>', f'@{mention.name}')
                     mentioned_users.append(mention.name)
 
-                async with message.channel.typing():
-                    # Use the actual username (not display name) for the message author
-                    response = await self.bot.ai_client.chat_with_model(
-                        message.author.id,
-                        processed_content,
-                        self.bot.conversation_manager,
-                        username=message.author.name  # Explicitly using actual username
-                    )
-
-                if isinstance(response, str):
-                    # Truncate response if needed
-                    if len(response) > 1900:
-                        response = response[:1900] + "..."
-
-                    # Save the original message for re-roll
-                    self.bot.conversation_manager.save_original_message(message.author.id, processed_content)
+                if MESSAGE_DEBOUNCE_WINDOW > 0:
+                    self.debouncer.submit((message.author.id, message.channel.id), (message, processed_content))
+                else:
+                    await self.respond(message, processed_content)
 
-                    # Create a view with the re-roll button
-                    view = View()
-                    view.add_item(ReRollButton(user_id=message.author.id))
-                    view.add_item(ContinueButton(user_id=message.author.id))
-                    view.add_item(ClearHistoryButton(user_id=message.author.id))
+        except Exception as e:
+            error_msg = f"Error processing message: {str(e)}"
+            logger.error(error_msg, extra={'user_id': message.author.id, 'command': 'on_message'})
+            await message.channel.send(f"An error occurred while processing your message: {str(e)}")
 
-                    # Send the AI response and save the message ID
-                    ai_response_message = await message.reply(
-                        response.encode('utf-8', errors='ignore').decode('utf-8'), 
-                        view=view
+    async def respond_to_burst(self, key, burst):
+        """Answer messages sent in quick succession as a single user turn, replying to the last one"""
+        message = burst[-1][0]
+        processed_content = "\n".join(content for _, content in burst)
+        if len(burst) > 1:
+            logger.info(f"Coalesced {len(burst)} messages into one turn", 
+                       extra={'user_id': message.author.id, 'command': 'on_message'})
+        await self.respond(message, processed_content)
+
+    async def respond(self, message, processed_content):
+        """Generate a reply to ``processed_content`` and post it as a reply to ``message``"""
+        try:
+            # Stream the reply into a progressively edited message when enabled
+            streaming_reply = StreamingReply(message) if STREAM_RESPONSES else None
+
+            async with message.channel.typing():
+                # Use the actual username (not display name) for the message author
+                response = await self.bot.ai_client.chat_with_model(
+                    message.author.id,
+                    processed_content,
+                    self.bot.conversation_manager,
+                    username=message.author.name,  # Explicitly using actual username
+                    on_partial=streaming_reply.update if streaming_reply else None,
+                    priority=request_priority(message.author, message.channel),
+                    persona=self.bot.conversation_manager.resolve_persona(
+                        message.channel.id, message.guild.id if message.guild else None
                     )
-                    self.bot.conversation_manager.save_response_message_id(message.author.id, ai_response_message.id)
+                )
+
+            if response is None:
+                # Superseded by a newer message, re-roll or clear
+                if streaming_reply:
+                    await streaming_reply.discard()
+                return
+
+            if isinstance(response, ErrorReply):
+                # A plain notice without buttons; the conversation and the saved reply are unchanged
+                if streaming_reply:
+                    await streaming_reply.discard()
+                await message.reply(response)
+            elif isinstance(response, str):
+                # Save the original message for re-roll
+                self.bot.conversation_manager.save_original_message(message.author.id, processed_content)
+
+                # Attach the re-roll, continue and clear buttons
+                view = reply_controls(message.author.id)
+
+                # Send the AI response, split at sentence boundaries when it is too long for
+                # one message, with the buttons on the last part, and save the IDs of every part
+                chunks = paginate(response.encode('utf-8', errors='ignore').decode('utf-8'))
+                first_view = view if len(chunks) == 1 else None
+                if streaming_reply:
+                    ai_response_message = await streaming_reply.finish(chunks[0], view=first_view)
                 else:
-                    # If response is not a string, it's likely an error message
-                    await message.reply(response, ephemeral=True)
+                    ai_response_message = await message.reply(chunks[0], view=first_view)
+                response_messages = [ai_response_message]
+                if len(chunks) > 1:
+                    response_messages += await send_paginated(message.channel.send, chunks[1:], view=view)
+                self.bot.conversation_manager.save_response_messages(
+                    message.author.id, [response_message.id for response_message in response_messages]
+                )
+
+                # Prefetch spare candidates so a re-roll can be served instantly
+                self.bot.ai_client.prefetch_rerolls(message.author.id, self.bot.conversation_manager)
 
         except Exception as e:
             error_msg = f"Error processing message: {str(e)}"
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,6 +16,123 @@ TEXTGEN_DIR = "textgen"
 PRELOADS_DIR = "preloads"
 CHAT_LOGS_DIR = "chat_logs"
 
+# Persona used wherever no other persona is assigned, by preload file name without extension
+DEFAULT_PERSONA = os.getenv("DEFAULT_PERSONA", "example_dialogue")
+
+# Parameter presets in TEXTGEN_DIR are validated at startup and reloaded when
+# their files change, checked every PRESET_POLL_INTERVAL seconds.
+PRESET_POLL_INTERVAL = float(os.getenv("PRESET_POLL_INTERVAL", "5.0"))  # seconds, 0 to disable reloading
+
+# Streaming configuration
+# When enabled, replies are streamed from the API and the Discord message is
+# edited progressively as tokens arrive.
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # seconds between message edits
+
+# Continuation configuration
+# "Continue" sends the last reply as the final message of the request and asks
+# the API to extend it in place with these parameters, instead of adding a
+# "please continue" turn to the conversation. The defaults are the chat template
+# options of vLLM-style backends; a backend that ignores them answers with a new
+# reply, which is detected and reported instead of being merged.
+CONTINUE_REQUEST_PARAMS = json.loads(
+    os.getenv("CONTINUE_REQUEST_PARAMS", '{"continue_final_message": true, "add_generation_prompt": false}')
+)
+
+# Message debounce configuration
+# Messages a user sends in the same channel within MESSAGE_DEBOUNCE_WINDOW seconds
+# of each other are merged into one turn and answered with a single reply. A
+# burst is answered after MESSAGE_DEBOUNCE_MAX_WAIT seconds at the latest.
+MESSAGE_DEBOUNCE_WINDOW = float(os.getenv("MESSAGE_DEBOUNCE_WINDOW", "0"))  # seconds, 0 to disable
+MESSAGE_DEBOUNCE_MAX_WAIT = float(os.getenv("MESSAGE_DEBOUNCE_MAX_WAIT", "5.0"))  # seconds, 0 for no limit
+
+# Re-roll prefetch configuration
+# "off" disables prefetching, "choices" requests spare candidates alongside the
+# reply using the "n" parameter, "background" requests them after the reply is sent.
+REROLL_PREFETCH_MODE = os.getenv("REROLL_PREFETCH_MODE", "off").lower()
+REROLL_PREFETCH_COUNT = int(os.getenv("REROLL_PREFETCH_COUNT", "2"))  # spare candidates per reply
+
+# Request dispatch configuration
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))  # global cap on upstream API calls
+USER_QUEUE_LIMIT = int(os.getenv("USER_QUEUE_LIMIT", "3"))  # pending requests per user, 0 for no limit
+
+# Share of upstream slots each priority class gets when requests are queued, as
+# "class:weight" pairs. Classes: admin, reroll, dm, channel and background (re-roll prefetches).
+PRIORITY_WEIGHTS = {
+    priority: float(weight)
+    for priority, weight in (
+        pair.split(":") for pair in os.getenv(
+            "PRIORITY_WEIGHTS", "admin:8,reroll:4,dm:4,channel:2,background:1"
+        ).split(",") if pair.strip()
+    )
+}
+
+# Rate limiting and retry configuration
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "5"))  # requests per second
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", "10"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+API_RETRY_BASE_DELAY = float(os.getenv("API_RETRY_BASE_DELAY", "1.0"))  # seconds
+API_RETRY_MAX_DELAY = float(os.getenv("API_RETRY_MAX_DELAY", "30.0"))  # seconds
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))  # consecutive failures
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30.0"))  # seconds
+
+# Hedged request configuration
+# When enabled, a reply that hasn't started arriving within the tracked
+# HEDGE_PERCENTILE latency is requested a second time, from HEDGE_FALLBACK_MODEL
+# if set (otherwise the same model); whichever answers first is used. Conversations
+# are trimmed to fit the smaller of the two models' context sizes.
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_FALLBACK_MODEL = os.getenv("HEDGE_FALLBACK_MODEL", "")  # e.g. "magnum-72b-v4"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "10.0"))  # seconds, until enough latencies are tracked
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))  # seconds
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # latencies tracked before the percentile is used
+
+# HTTP transport configuration
+# Connections to the API are pooled and kept alive between requests; a few are
+# opened at startup and the endpoint is touched periodically while idle so the
+# first request after a quiet spell doesn't pay for a new TLS handshake.
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # open connections in total, 0 for no limit
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "32"))  # 0 for no limit
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "75"))  # seconds an idle connection is kept
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))  # seconds DNS answers are cached
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))  # seconds without data from the API
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "300"))  # seconds for a whole request
+HTTP_PREWARM_CONNECTIONS = int(os.getenv("HTTP_PREWARM_CONNECTIONS", "2"))  # connections opened at startup
+HTTP_KEEPALIVE_INTERVAL = float(os.getenv("HTTP_KEEPALIVE_INTERVAL", "60"))  # idle seconds between pings, 0 to disable
+
+# Token counting configuration
+# A Hugging Face tokenizer.json for the model gives exact token counts when the
+# optional 'tokenizers' package is installed; otherwise counts are estimated.
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "tokenizer.json")
+
+# Context trimming configuration
+# Once a conversation exceeds its token budget, old messages are dropped until it
+# is under this fraction of the budget. Trimming in large blocks keeps the start
+# of the prompt identical across many turns, which lets the API reuse its prompt cache.
+CONTEXT_TRIM_LOW_WATER = float(os.getenv("CONTEXT_TRIM_LOW_WATER", "0.75"))
+
+# Background file writer configuration
+WRITER_QUEUE_SIZE = int(os.getenv("WRITER_QUEUE_SIZE", "10000"))  # pending writes before callers wait
+WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "500"))  # writes per batch
+WRITER_FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", "0.2"))  # seconds to gather a batch
+WRITER_FSYNC = os.getenv("WRITER_FSYNC", "never").lower()  # "never" or "batch"
+
+# Conversation store configuration
+# Conversation state is persisted to SQLite so restarts don't lose history;
+# set CONVERSATION_DB_PATH to an empty value to keep everything in memory only.
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join("data", "conversations.db"))
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "5.0"))  # seconds between write-behind flushes
+
+# Conversation cache configuration
+# Users are evicted from memory (and written to the conversation store) when idle
+# for CACHE_IDLE_TIMEOUT seconds or when the cache exceeds its size limits; they
+# are reloaded transparently on their next message. Requires the conversation store.
+CACHE_MAX_USERS = int(os.getenv("CACHE_MAX_USERS", "1000"))  # 0 for no limit
+CACHE_MEMORY_BUDGET_MB = float(os.getenv("CACHE_MEMORY_BUDGET_MB", "256"))  # 0 for no limit
+CACHE_IDLE_TIMEOUT = float(os.getenv("CACHE_IDLE_TIMEOUT", "3600"))  # seconds, 0 to disable
+
 # Model configuration
 AVAILABLE_MODELS = {
     "magnum-72b": 16384,
@@ -74,6 +192,40 @@ DEFAULT_AI_PARAMS = {
     "top_logprobs": None
 }
 
+# Values the API already uses when a parameter is omitted. Parameters equal to
+# these are left out of requests to keep the bodies small; "model" and
+# "max_tokens" are always sent.
+PRUNE_DEFAULT_PARAMS = os.getenv("PRUNE_DEFAULT_PARAMS", "true").lower() in ("1", "true", "yes")
+SERVER_DEFAULT_PARAMS = {
+    "response_config": None,
+    "temperature": 1,
+    "min_p": 0,
+    "top_p": 1,
+    "repetition_penalty": 1,
+    "n": 1,
+    "min_tokens": 0,
+    "dynatemp_mode": 0,
+    "presence_penalty": 0,
+    "frequency_penalty": 0,
+    "top_k": 0,
+    "epsilon_cutoff": 0,
+    "top_a": 0,
+    "typical_p": 1,
+    "eta_cutoff": 0,
+    "tfs": 1,
+    "smoothing_factor": 0,
+    "mirostat_mode": 0,
+    "logit_bias": None,
+    "ignore_eos": False,
+    "stop": [],
+    "custom_token_bans": [],
+    "stream": False,
+    "custom_timeout": None,
+    "allow_logging": None,
+    "logprobs": False,
+    "top_logprobs": None
+}
+
 # Create necessary directories
 for directory in [TEXTGEN_DIR, PRELOADS_DIR, CHAT_LOGS_DIR]:
     if not os.path.exists(directory):
@@ -1,19 +1,99 @@
 # services/ai_client.py
 
+import asyncio
 import json
+import random
+import time
 import aiohttp
 import logging
-from config.settings import API_KEY, API_URL, DEFAULT_AI_PARAMS
+from services.request_dispatcher import RequestDispatcher, QueueFullError
+from services.http_transport import HttpTransport
+from services.hedging import HedgePolicy
+from services.parameters import apply_request_overrides
+from services.response_processor import trim_incomplete_response, join_continuation, restarts_reply
+from services.rate_limiter import TokenBucket, CircuitBreaker, parse_retry_after
+from utils import json_codec
+from config.settings import (
+    API_KEY, API_URL, STREAM_RESPONSES, CONTINUE_REQUEST_PARAMS,
+    REROLL_PREFETCH_MODE, REROLL_PREFETCH_COUNT,
+    API_MAX_RETRIES, API_RETRY_BASE_DELAY, API_RETRY_MAX_DELAY
+)
 
 logger = logging.getLogger('discord')
 
+# Statuses worth retrying besides rate limits
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+# Temperatures offered by the re-roll menu in cogs/events.py
+REROLL_TEMPERATURES = (0.7, 1.0, 1.3, 1.5)
+
+def reroll_sampling(params):
+    """The temperature and top_p a re-roll starting from ``params`` samples at"""
+    return params.get('temperature', 1.0) + 0.1, min(params.get('top_p', 1.0) + 0.05, 1.0)
+
+def menu_temperature(temperature):
+    """The re-roll menu option equal to ``temperature``, or None"""
+    return next((option for option in REROLL_TEMPERATURES if abs(option - temperature) < 1e-6), None)
+
+def choices_prefetch_temperature(params):
+    """The menu option whose re-roll samples exactly like ``params``, or None.
+
+    Spare choices share the reply's parameters, so only that option can use them.
+    """
+    sampling = (params.get('temperature', 1.0), params.get('top_p', 1.0))
+    for option in REROLL_TEMPERATURES:
+        temperature, top_p = reroll_sampling({**params, 'temperature': option})
+        if abs(temperature - sampling[0]) < 1e-6 and abs(top_p - sampling[1]) < 1e-6:
+            return option
+    return None
+
+async def iter_sse_data(content):
+    """Yield the data of each server-sent event line in ``content``, an iterable of byte chunks.
+
+    Chunks may end mid-line; a line is only decoded once it is complete.
+    """
+    buffer = b""
+    async for chunk in content:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw_line in lines:
+            line = raw_line.decode('utf-8').strip()
+            if line.startswith('data:'):
+                yield line[len('data:'):].strip()
+
+    line = buffer.decode('utf-8').strip()
+    if line.startswith('data:'):
+        yield line[len('data:'):].strip()
+
+class CompletionError(Exception):
+    """A completion request that failed for good, after any retries"""
+
+class ErrorReply(str):
+    """A message to show the user instead of a reply; the conversation was left unchanged"""
+
 class AIClient:
     def __init__(self):
         self.session = None
+        self.transport = HttpTransport(API_URL)
+        self.prefetch_tasks = {}  # user id -> background re-roll prefetch
+        self.generations = {}  # user id -> in-flight generation
+        self.superseded = set()  # generations cancelled by a newer action
+        self.cancelled_generations = 0
+        self.cancelled_prefetches = 0
+        self.dispatcher = RequestDispatcher()
+        self.rate_limiter = TokenBucket()
+        self.circuit_breaker = CircuitBreaker()
+        self.hedging = HedgePolicy()
 
     async def initialize(self):
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            self.session = self.transport.create_session()
+            self.transport.start_keepalive()
+
+    async def prewarm(self):
+        """Open pooled connections to the API so the first requests skip the TLS handshake"""
+        await self.initialize()
+        await self.transport.prewarm()
 
     async def chat_with_model(
         self, 
@@ -22,19 +102,120 @@ class AIClient:
         conversation_manager, 
         username=None, 
         reroll=False, 
+        on_partial=None,
+        priority=None,
+        continue_last=False,
+        persona=None,
         **kwargs
     ):
-        if self.session is None:
-            await self.initialize()
+        """Generate a reply for the user and commit it to the conversation history.
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {API_KEY}"
-        }
+        If streaming is enabled and ``on_partial`` is given, the reply is streamed
+        and ``on_partial`` is awaited with the accumulated text as tokens arrive.
+        The history is only updated once the full reply has been received.
+        Requests for the same user are queued and run one at a time; when the API
+        is busy, ``priority`` ("admin", "reroll", "dm" or "channel") decides the
+        class the request is scheduled in.
+
+        With ``continue_last`` the API extends the last reply instead of answering
+        ``new_message``; the reply is updated in place and only the new text is returned.
+        A ``persona`` other than the conversation's current one replaces its system
+        prompt and example dialogue, keeping the user's turns.
+
+        A newer message or re-roll from the same user cancels this generation, in
+        which case None is returned and no reply is added to the history. Failures,
+        including a full request queue, return an ErrorReply to show instead.
+        """
+        async def generate():
+            # Keep the user's state in memory while the request holds their history
+            with conversation_manager.pinned(user_id):
+                return await self._generate(
+                    user_id, new_message, conversation_manager,
+                    username=username, reroll=reroll, on_partial=on_partial,
+                    continue_last=continue_last, persona=persona, **kwargs
+                )
+
+        # Superseded requests count as pending until the user gets a reply, and a
+        # rejected one leaves the generation in flight alone
+        try:
+            self.dispatcher.admit(user_id)
+        except QueueFullError as e:
+            return ErrorReply(str(e))
+
+        self.cancel_generation(user_id)
+        priority = priority or ("reroll" if reroll else "channel")
+        task = asyncio.create_task(self.dispatcher.run(user_id, generate, priority))
+        self.generations[user_id] = task
+        try:
+            return await task
+        except QueueFullError as e:
+            return ErrorReply(str(e))
+        except asyncio.CancelledError:
+            if task not in self.superseded:
+                raise
+            return None
+        finally:
+            self.superseded.discard(task)
+            if self.generations.get(user_id, task) is task:
+                # No newer request replaced this one
+                self.generations.pop(user_id, None)
+                self.dispatcher.settle(user_id)
+
+    def cancel_generation(self, user_id):
+        """Cancel the user's in-flight generation and re-roll prefetch, if any.
 
-        # Get user-specific parameters
-        params = conversation_manager.get_user_params(user_id).copy()
-        params.update(kwargs)
+        Cancelling closes the HTTP request, so the API stops generating as well.
+        Returns whether a generation was cancelled.
+        """
+        prefetch = self.prefetch_tasks.pop(user_id, None)
+        if prefetch is not None and not prefetch.done():
+            prefetch.cancel()
+            self.cancelled_prefetches += 1
+
+        task = self.generations.pop(user_id, None)
+        if task is None or task.done():
+            return False
+        self.superseded.add(task)
+        task.cancel()
+        self.cancelled_generations += 1
+        logger.info("Cancelled superseded generation", extra={'user_id': user_id, 'command': 'chat_with_model'})
+        return True
+
+    async def serve_prefetched_reroll(self, user_id, conversation_manager, temperature):
+        """Replace the last reply with a buffered re-roll candidate, if one matches ``temperature``"""
+        if REROLL_PREFETCH_MODE == "off" or REROLL_PREFETCH_COUNT <= 0:
+            return None
+        self.cancel_generation(user_id)
+
+        async def serve():
+            candidate = conversation_manager.pop_reroll_candidate(user_id, temperature)
+            if candidate is not None:
+                conversation_manager.update_last_response(user_id, candidate)
+                conversation_manager.save_conversation_log(user_id)
+            return candidate
+
+        try:
+            # Only the user's lock is needed; the candidate is already in memory
+            return await self.dispatcher.run_local(user_id, serve)
+        except QueueFullError:
+            return None
+
+    async def _generate(
+        self, 
+        user_id, 
+        new_message, 
+        conversation_manager, 
+        username=None, 
+        reroll=False, 
+        on_partial=None,
+        continue_last=False,
+        persona=None,
+        **kwargs
+    ):
+        # Get user-specific parameters; anything changed for this request is also
+        # layered over the pruned parameters that are sent to the API
+        params = {**conversation_manager.get_user_params(user_id), **kwargs}
+        request_overrides = dict(kwargs)
 
         if reroll:
             # Save current parameters before modifying
@@ -42,185 +223,442 @@ class AIClient:
             conversation_manager.save_reroll_parameters(user_id, current_params)
 
             # Adjust parameters for this user only
-            params['temperature'] = params.get('temperature', 1.0) + 0.1
-            params['top_p'] = min(params.get('top_p', 1.0) + 0.05, 1.0)
+            params['temperature'], params['top_p'] = reroll_sampling(params)
+            request_overrides['temperature'] = params['temperature']
+            request_overrides['top_p'] = params['top_p']
 
         # Get user conversation history
         history = conversation_manager.get_conversation(user_id)
 
-        if not history:
-            # Add system message for personality
-            system_message = conversation_manager.get_ai_personality()
-            if username:
-                system_message += f"\nYou are talking to Discord user '{username}'."
-            history.append({"role": "system", "content": system_message})
+        # Start from, or switch to, the persona's shared system message and pre-loaded conversation
+        persona = persona or history.prefix or conversation_manager.get_prompt_prefix()
+        if history.prefix is not persona:
+            system_suffix = f"\nYou are talking to Discord user '{username}'." if username else history.system_suffix
+            conversation_manager.set_prefix(user_id, persona, system_suffix)
 
-            # Load pre-loaded conversation if enabled
-            if conversation_manager.should_load_example_dialogue():
-                history.extend(conversation_manager.get_example_dialogue())
+        replaced_response = None
+        previous_response = None
+        if continue_last:
+            # Send the last reply as the final message for the API to extend, so
+            # continuing adds no turn to the history
+            if not history or history[-1]['role'] != 'assistant':
+                return ErrorReply("There's no previous response to continue from.")
+            previous_response = history[-1]['content']
+            request_overrides.update(CONTINUE_REQUEST_PARAMS)
 
-        if reroll:
+            # Prefetched alternatives no longer match the extended reply
+            conversation_manager.clear_reroll_candidates(user_id)
+        elif reroll:
             # For rerolls, we want to keep everything up to the last user message
             # Remove the last assistant response if it exists
             if history and history[-1]['role'] == 'assistant':
-                history.pop()
+                replaced_response = history.pop()
         else:
+            # A new message invalidates any prefetched re-roll candidates
+            conversation_manager.clear_reroll_candidates(user_id)
+
             # For new messages, add the user message with actual username
             user_message = f"{username}: {new_message}" if username else new_message
             history.append({"role": "user", "content": user_message})
 
-        # Manage token context limit
-        conversation_manager.manage_conversation_length(user_id)
+        succeeded = False
+        try:
+            # Manage token context limit
+            conversation_manager.manage_conversation_length(user_id)
 
-        data = {
-            "messages": history,
-            **params
-        }
+            stream = STREAM_RESPONSES and on_partial is not None
+
+            request_overrides["stream"] = stream
+
+            # Ask for spare candidates in the same request so re-rolls can be served instantly,
+            # as long as a menu option re-rolls with the same parameters as this reply
+            prefetch_temperature = None
+            if (REROLL_PREFETCH_MODE == "choices" and not stream and not reroll and not continue_last
+                    and REROLL_PREFETCH_COUNT > 0):
+                prefetch_temperature = choices_prefetch_temperature(params)
+            if prefetch_temperature is not None:
+                request_overrides["n"] = 1 + REROLL_PREFETCH_COUNT
+
+            request_params = apply_request_overrides(conversation_manager.get_request_params(user_id), request_overrides)
+            encoded_messages = history.encode_messages()
+            body = self._encode_request(encoded_messages, request_params)
+            timeout = self.transport.request_timeout(params.get("custom_timeout"))
+
+            # The same prompt, possibly for the fallback model, in case the first request is slow
+            hedge_body = None
+            if self.hedging.enabled:
+                hedge_model = self.hedging.hedge_model(request_params.get("model"))
+                hedge_body = self._encode_request(encoded_messages, {**request_params, "model": hedge_model})
+
+            response_json = await self._request_hedged(
+                user_id, body, hedge_body, on_partial if stream else None, timeout=timeout
+            )
+
+            if not response_json.get("choices"):
+                logger.error("API returned no choices", extra={'user_id': user_id, 'command': 'chat_with_model'})
+                return ErrorReply("The AI model returned an empty response. Please try again.")
+
+            content = response_json["choices"][0]["message"]["content"] or ""
+            finish_reason = response_json["choices"][0].get("finish_reason")
+
+            if not content.strip():
+                logger.error("API returned empty content", extra={'user_id': user_id, 'command': 'chat_with_model'})
+                return ErrorReply("The AI model returned an empty response. Please try again.")
+
+            if continue_last:
+                return self._commit_continuation(
+                    user_id, conversation_manager, history, previous_response, content, finish_reason
+                )
+
+            ai_response = trim_incomplete_response(content.strip(), finish_reason)
+
+            if prefetch_temperature is not None:
+                candidates = self._collect_candidates(response_json["choices"][1:])
+                if candidates:
+                    conversation_manager.store_reroll_candidates(user_id, candidates, prefetch_temperature)
+
+            # Add the AI's response to the conversation history
+            history.append({"role": "assistant", "content": ai_response})
+            succeeded = True
+
+            # Update the conversation in the manager before saving
+            conversation_manager.set_conversation(user_id, history)
+
+            # Save conversation and update last response
+            conversation_manager.save_conversation_log(user_id)
+            conversation_manager.set_last_response(user_id, ai_response)
+
+            # Trim the conversation if needed
+            conversation_manager.manage_conversation_length(user_id)
+
+            return ai_response
+
+        except CompletionError as e:
+            return ErrorReply(str(e))
 
-        try:
-            async with self.session.post(API_URL, headers=headers, json=data) as response:
-                response_json = await response.json()
-                
-                if response.status == 200:
-                    if not response_json.get("choices"):
-                        logger.error("API returned no choices", extra={'user_id': user_id, 'command': 'chat_with_model'})
-                        return "The AI model returned an empty response. Please try again."
-                    
-                    ai_response = response_json["choices"][0]["message"]["content"].strip()
-                    finish_reason = response_json["choices"][0].get("finish_reason")
-                    
-                    if not ai_response:
-                        logger.error("API returned empty content", extra={'user_id': user_id, 'command': 'chat_with_model'})
-                        return "The AI model returned an empty response. Please try again."
-                    
-                    # Process response if it didn't finish naturally
-                    if finish_reason != "stop":
-                        # Common abbreviations that don't end sentences
-                        abbreviations = {
-                            'mr.', 'mrs.', 'ms.', 'dr.', 'prof.', 'sr.', 'jr.',
-                            'vs.', 'etc.', 'e.g.', 'i.e.',
-                            'inc.', 'ltd.', 'corp.', 'llc.', 'co.'
-                        }
-                        
-                        # Split into sentences more carefully
-                        sentences = []
-                        last_end = 0
-                        
-                        for i, char in enumerate(ai_response):
-                            if char in '.!?':
-                                # Get the word ending at this period
-                                word_start = max(0, ai_response.rfind(' ', 0, i) + 1)
-                                word_with_period = ai_response[word_start:i+1].lower()
-                                
-                                is_sentence_end = True
-                                
-                                # Skip abbreviations
-                                if word_with_period in abbreviations:
-                                    is_sentence_end = False
-                                
-                                # Skip numbers (e.g. "3.14")
-                                elif i > 0 and i < len(ai_response) - 1:
-                                    if ai_response[i-1].isdigit() and ai_response[i+1].isdigit():
-                                        is_sentence_end = False
-                                
-                                # Skip if no space after (unless it's the end)
-                                elif i < len(ai_response) - 1 and not ai_response[i+1].isspace():
-                                    is_sentence_end = False
-                                
-                                if is_sentence_end:
-                                    sentence = ai_response[last_end:i+1].strip()
-                                    if sentence:
-                                        sentences.append(sentence)
-                                        last_end = i + 1
-                        
-                        # Add remaining text if any
-                        remaining = ai_response[last_end:].strip()
-                        if remaining:
-                            sentences.append(remaining)
-                        
-                        # Check for incomplete endings
-                        incomplete_endings = [
-                            'and', 'but', 'or', 'nor', 'for', 'yet', 'so',
-                            'with', 'to', 'in', 'at', 'by',
-                            ',', ', and', ', or'
-                        ]
-                        
-                        # If we have sentences, process them
-                        if sentences:
-                            ai_response = ' '.join(sentences)
-                            last_words = ai_response.rstrip().lower().split()
-                            
-                            ends_with_incomplete = (
-                                not any(ai_response.rstrip().endswith(char) for char in '.!?') or
-                                (last_words and any(last_words[-1].endswith(ending) for ending in incomplete_endings))
-                            )
-                            
-                            # Handle malformed punctuation
-                            if '.' in ai_response and not ai_response.endswith('.'):
-                                last_period = ai_response.rindex('.')
-                                if last_period > len(ai_response) * 0.75:
-                                    ai_response = ai_response[:last_period + 1]
-                            
-                            if ends_with_incomplete:
-                                # Find the last complete sentence
-                                last_complete = -1
-                                for i, char in enumerate(ai_response):
-                                    if char in '.!?':
-                                        text_after = ai_response[i+1:].strip()
-                                        words_after = text_after.lower().split()
-                                        if not words_after or words_after[0] not in incomplete_endings:
-                                            last_complete = i
-                                
-                                if last_complete != -1:
-                                    ai_response = ai_response[:last_complete + 1].strip()
-                
-                    # Add the AI's response to the conversation history
-                    history.append({"role": "assistant", "content": ai_response})
-                    
-                    # Update the conversation in the manager before saving
-                    conversation_manager.set_conversation(user_id, history)
-                    
-                    # Save conversation and update last response
-                    conversation_manager.save_conversation_log(user_id)
-                    conversation_manager.set_last_response(user_id, ai_response)
-                    
-                    # Trim the conversation if needed
-                    conversation_manager.manage_conversation_length(user_id)
-                    
-                    return ai_response
-                else:
-                    error_json = await response.json()
-                    error_message = error_json.get('error', {}).get('message', 'Unknown error occurred')
-                    error_type = error_json.get('error', {}).get('type', 'UNKNOWN_ERROR')
-                    
-                    user_friendly_message = {
-                        'AUTHENTICATION_FAILURE': "I'm having trouble authenticating with my AI service. Please notify the bot administrator.",
-                        'MODEL_OFFLINE': "The AI model is temporarily unavailable. Please try again in a few minutes.",
-                        'CONTEXT_LENGTH_EXCEEDED': "The conversation is too long. Please try clearing history with /clear_history.",
-                        'RATE_LIMIT_EXCEEDED': "Too many requests. Please wait a moment before trying again.",
-                        'UNKNOWN_ERROR': f"An unexpected error occurred (Status {response.status}): {error_message}"
-                    }.get(error_type, f"API Error: {error_message}")
-                    
-                    logger.error(f"API Error {response.status}: {error_json}", 
-                                extra={'user_id': user_id, 'command': 'chat_with_model'})
-                    return user_friendly_message
-
-        except aiohttp.ClientError as e:
-            error_message = f"Network error: {str(e)}"
-            logger.error(error_message, extra={'user_id': user_id, 'command': 'chat_with_model'})
-            return "I'm having trouble connecting to the AI service. Please try again in a moment."
-            
-        except json.JSONDecodeError as e:
-            error_message = f"Invalid API response: {str(e)}"
-            logger.error(error_message, extra={'user_id': user_id, 'command': 'chat_with_model'})
-            return "I received an invalid response from the AI service. Please try again."
-            
         except Exception as e:
             error_message = f"Unexpected error: {str(e)}"
             logger.error(error_message, extra={'user_id': user_id, 'command': 'chat_with_model'})
-            return f"An unexpected error occurred: {str(e)}"
+            return ErrorReply(f"An unexpected error occurred: {str(e)}")
+
+        finally:
+            # A re-roll that failed or was superseded puts the previous reply back.
+            # The user's message stays in the history for the next reply to see.
+            if replaced_response is not None and not succeeded:
+                history.append(replaced_response)
+
+    def _commit_continuation(self, user_id, conversation_manager, history, previous_response, content, finish_reason):
+        """Extend the last reply with ``content`` and return the new text"""
+        if restarts_reply(previous_response, content):
+            # The backend ignored CONTINUE_REQUEST_PARAMS and answered with a new reply
+            logger.warning("API restarted the reply instead of continuing it; check CONTINUE_REQUEST_PARAMS",
+                          extra={'user_id': user_id, 'command': 'chat_with_model'})
+            return ErrorReply("The model started a new reply instead of continuing this one. Please try again.")
+
+        # An unfinished sentence is trimmed, but never back into the original reply
+        combined_response = join_continuation(previous_response, content.rstrip())
+        trimmed_response = trim_incomplete_response(combined_response, finish_reason)
+        if len(trimmed_response) > len(previous_response):
+            combined_response = trimmed_response
+
+        history.set_content(len(history) - 1, combined_response)
+        conversation_manager.set_conversation(user_id, history)
+        conversation_manager.save_conversation_log(user_id)
+        conversation_manager.set_last_response(user_id, combined_response)
+        return combined_response[len(previous_response):].strip()
+
+    async def _request_hedged(self, user_id, body, hedge_body, on_partial=None, timeout=None):
+        """Send a completion request, hedging with ``hedge_body`` when it is slower than usual.
+
+        The first request to deliver something (streamed text, or the whole reply)
+        wins and the other one is cancelled; if one fails the other keeps going.
+        Without a ``hedge_body`` the request is only timed.
+        """
+        stream = on_partial is not None
+        started = time.monotonic()
+        attempts = []
+        winner = None
+
+        def claim(index):
+            nonlocal winner
+            if winner is None:
+                winner = index
+                self.hedging.record(stream, time.monotonic() - started)
+                for other, task in enumerate(attempts):
+                    if other != index:
+                        task.cancel()
+                if index:
+                    self.hedging.hedge_wins += 1
+                    logger.info("Hedged request answered first", extra={'user_id': user_id, 'command': 'chat_with_model'})
+            return winner == index
+
+        def start(request_body):
+            index = len(attempts)
+
+            async def report_progress(text):
+                if claim(index):
+                    await on_partial(text)
+
+            attempts.append(asyncio.create_task(self._request_completion(
+                user_id, request_body, report_progress if stream else None, timeout=timeout
+            )))
+
+        start(body)
+        try:
+            if hedge_body is not None:
+                done, _ = await asyncio.wait(attempts, timeout=self.hedging.delay(stream))
+                if not done and winner is None:
+                    self.hedging.hedges_sent += 1
+                    start(hedge_body)
+
+            error = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        if claim(attempts.index(task)):
+                            return task.result()
+                    elif error is None or task is attempts[0]:
+                        # Report the first request's error when both fail
+                        error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def _encode_request(self, encoded_messages, params):
+        """Build the JSON request body around already encoded messages"""
+        encoded_params = json_codec.dumps(dict(params))
+        if params:
+            encoded_params = b", " + encoded_params[1:]
+        else:
+            encoded_params = b"}"
+        return b'{"messages": [' + encoded_messages + b"]" + encoded_params
+
+    async def _request_completion(self, user_id, body, on_partial=None, max_retries=API_MAX_RETRIES, timeout=None):
+        """POST an encoded completion request, retrying rate limits and transient failures.
+
+        Returns the decoded response body; a streamed reply is assembled into the
+        same shape. Streamed requests are only retried before any text was delivered.
+        Raises CompletionError with a user-facing message when the request fails.
+        """
+        if self.session is None:
+            await self.initialize()
+
+        delivered = False
+
+        async def report_progress(text):
+            nonlocal delivered
+            delivered = True
+            await on_partial(text)
+
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise CompletionError("The AI model is temporarily unavailable. Please try again in a few minutes.")
+
+            # The probe lets through a half-open breaker; if this attempt ends without
+            # recording an outcome (cancelled, invalid response), it must give it back
+            probe = self.circuit_breaker.probe_in_flight
+            try:
+                await self.rate_limiter.acquire()
+                self.transport.mark_used()
+
+                try:
+                    async with self.session.post(
+                        API_URL, headers=self._build_headers(), data=body, timeout=timeout or self.transport.request_timeout()
+                    ) as response:
+                        self.rate_limiter.update_from_headers(response.headers)
+
+                        if response.status == 200:
+                            if on_partial is not None:
+                                result = await self._read_stream(response, report_progress)
+                            else:
+                                result = json_codec.loads(await response.read())
+                            self.circuit_breaker.record_success()
+                            self.rate_limiter.record_success()
+                            return result
+
+                        status = response.status
+                        retry_after = parse_retry_after(response.headers)
+                        try:
+                            error_json = json_codec.loads(await response.read())
+                        except ValueError:
+                            error_json = {}
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.circuit_breaker.record_failure()
+                    if delivered or attempt >= max_retries:
+                        logger.error(f"Network error: {str(e)}", extra={'user_id': user_id, 'command': 'chat_with_model'})
+                        raise CompletionError("I'm having trouble connecting to the AI service. Please try again in a moment.")
+
+                    delay = self._backoff_delay(attempt)
+                    logger.warning(f"Network error, retrying in {delay:.1f}s: {str(e)}", 
+                                  extra={'user_id': user_id, 'command': 'chat_with_model'})
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                except json.JSONDecodeError as e:
+                    logger.error(f"Invalid API response: {str(e)}", extra={'user_id': user_id, 'command': 'chat_with_model'})
+                    raise CompletionError("I received an invalid response from the AI service. Please try again.")
+
+                error = error_json.get('error', {}) if isinstance(error_json, dict) else {}
+                error_message = error.get('message', 'Unknown error occurred')
+                error_type = error.get('type', 'UNKNOWN_ERROR')
+
+                rate_limited = status == 429 or error_type == 'RATE_LIMIT_EXCEEDED'
+                if rate_limited:
+                    self.rate_limiter.record_rate_limited(retry_after)
+
+                if error_type == 'MODEL_OFFLINE' or status >= 500:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+                retryable = rate_limited or (status in RETRYABLE_STATUSES and error_type != 'MODEL_OFFLINE')
+                if retryable and attempt < max_retries:
+                    delay = max(retry_after or 0.0, self._backoff_delay(attempt))
+                    logger.warning(f"API returned {status} ({error_type}), retrying in {delay:.1f}s", 
+                                  extra={'user_id': user_id, 'command': 'chat_with_model'})
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                user_friendly_message = {
+                    'AUTHENTICATION_FAILURE': "I'm having trouble authenticating with my AI service. Please notify the bot administrator.",
+                    'MODEL_OFFLINE': "The AI model is temporarily unavailable. Please try again in a few minutes.",
+                    'CONTEXT_LENGTH_EXCEEDED': "The conversation is too long. Please try clearing history with /clear_history.",
+                    'RATE_LIMIT_EXCEEDED': "Too many requests. Please wait a moment before trying again.",
+                    'UNKNOWN_ERROR': f"An unexpected error occurred (Status {status}): {error_message}"
+                }.get(error_type, f"API Error: {error_message}")
+
+                logger.error(f"API Error {status}: {json.dumps(error_json)}", 
+                            extra={'user_id': user_id, 'command': 'chat_with_model'})
+                raise CompletionError(user_friendly_message)
+            finally:
+                if probe:
+                    self.circuit_breaker.release_probe()
+
+    def _backoff_delay(self, attempt):
+        """Exponential backoff with jitter for the given retry attempt"""
+        delay = min(API_RETRY_MAX_DELAY, API_RETRY_BASE_DELAY * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def prefetch_rerolls(self, user_id, conversation_manager):
+        """Request spare re-roll candidates for the user's latest reply in the background"""
+        if REROLL_PREFETCH_MODE != "background" or REROLL_PREFETCH_COUNT <= 0:
+            return
+
+        message_id = conversation_manager.get_response_message_id(user_id)
+        task = asyncio.create_task(self.dispatcher.run_background(
+            lambda: self._prefetch_rerolls(user_id, conversation_manager, message_id)
+        ))
+        previous = self.prefetch_tasks.get(user_id)
+        if previous is not None:
+            previous.cancel()
+        self.prefetch_tasks[user_id] = task
+        task.add_done_callback(
+            lambda done: self.prefetch_tasks.pop(user_id) if self.prefetch_tasks.get(user_id) is done else None
+        )
+
+    async def _prefetch_rerolls(self, user_id, conversation_manager, message_id):
+        history = conversation_manager.get_conversation(user_id)
+        if not history or history[-1]['role'] != 'assistant':
+            return
+
+        # Sample the way a re-roll at the user's own temperature would, if the menu offers it
+        params = conversation_manager.get_user_params(user_id)
+        prefetch_temperature = menu_temperature(params.get('temperature', 1.0))
+        if prefetch_temperature is None:
+            return
+        temperature, top_p = reroll_sampling(params)
+        request_params = apply_request_overrides(
+            conversation_manager.get_request_params(user_id),
+            {"n": REROLL_PREFETCH_COUNT, "stream": False, "temperature": temperature, "top_p": top_p}
+        )
+        body = self._encode_request(history.encode_messages(end=-1), request_params)
+
+        try:
+            response_json = await self._request_completion(
+                user_id, body, max_retries=0, timeout=self.transport.request_timeout(params.get("custom_timeout"))
+            )
+        except CompletionError as e:
+            logger.warning(f"Re-roll prefetch failed: {str(e)}", 
+                          extra={'user_id': user_id, 'command': 'prefetch_rerolls'})
+            return
+
+        candidates = self._collect_candidates(response_json.get("choices") or [])
+
+        # Discard the candidates if the user has moved on to a newer reply
+        if candidates and conversation_manager.get_response_message_id(user_id) == message_id:
+            conversation_manager.store_reroll_candidates(
+                user_id, candidates, prefetch_temperature, message_id=message_id
+            )
+
+    def _collect_candidates(self, choices):
+        """Clean the content of spare choices, skipping empty ones"""
+        candidates = []
+        for choice in choices:
+            content = ((choice.get("message") or {}).get("content") or "").strip()
+            if content:
+                candidates.append(trim_incomplete_response(content, choice.get("finish_reason")))
+        return candidates
+
+    def get_metrics(self):
+        """Collect runtime metrics, grouped by component"""
+        return {
+            "dispatcher": self.dispatcher.get_metrics(),
+            "rate_limiter": self.rate_limiter.get_metrics(),
+            "circuit_breaker": self.circuit_breaker.get_metrics(),
+            "transport": self.transport.get_metrics(),
+            "hedging": self.hedging.get_metrics(),
+            "generations": {
+                "in_flight": len(self.generations),
+                "cancelled": self.cancelled_generations,
+                "cancelled_prefetches": self.cancelled_prefetches,
+            },
+        }
+
+    def _build_headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {API_KEY}"
+        }
+
+    async def _read_stream(self, response, on_partial):
+        """Consume a server-sent event stream, reporting progress to ``on_partial``.
+
+        Returns the accumulated reply in the shape of a non-streamed response body.
+        """
+        text = ""
+        finish_reason = None
+
+        async for payload in iter_sse_data(response.content):
+            if payload == '[DONE]':
+                break
+
+            chunk = json_codec.loads(payload)
+            choices = chunk.get("choices")
+            if not choices:
+                continue
+
+            choice = choices[0]
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                text += content
+                await on_partial(text)
+
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+
+        return {"choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}]}
 
     async def close(self):
-        if self.session:
-            await self.session.close()
-            self.session = None
+        for task in list(self.prefetch_tasks.values()) + list(self.generations.values()):
+            task.cancel()
+        await self.transport.close()
+        self.session = None
@@ -0,0 +1,132 @@
+# services/conversation.py
+
+from utils import json_codec
+
+class Conversation:
+    """A user's message history with cached per-message token counts and a running total.
+
+    The system prompt and example dialogue live in a shared ``PromptPrefix``;
+    ``messages`` only holds the user's own turns, and indexing, iteration and
+    trimming all apply to those turns. ``total_tokens`` includes the prefix.
+
+    All changes go through these methods so ``total_tokens`` never needs to be
+    recomputed from scratch. Appends, pops and edits are also recorded in
+    ``unlogged_changes`` until they are written to the conversation log; positions
+    are stored as offsets from the end, which trimming the front doesn't affect.
+    """
+    def __init__(self, estimator, messages=None, prefix=None, system_suffix=""):
+        self.estimator = estimator
+        self.messages = []
+        self.token_counts = []
+        self.total_tokens = 0
+        self.unlogged_changes = []
+        self.log_session = None
+        self.prefix = None
+        self.system_suffix = ""
+        self.prefix_tokens = 0
+        if prefix is not None:
+            self.set_prefix(prefix, system_suffix)
+        if messages:
+            self.extend(messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def set_prefix(self, prefix, system_suffix=""):
+        """Start the conversation with the shared ``prefix``, adding ``system_suffix`` to its system prompt.
+
+        A prefix that is already set is replaced; the user's turns are kept.
+        """
+        replaced = len(self.prefix) if self.prefix is not None else 0
+        tokens = prefix.count_tokens(self.estimator, system_suffix)
+        self.total_tokens += tokens - self.prefix_tokens
+        self.prefix = prefix
+        self.system_suffix = system_suffix
+        self.prefix_tokens = tokens
+        change = {"op": "prefix", "messages": prefix.messages(system_suffix)}
+        if replaced:
+            change["replaces"] = replaced
+        self.unlogged_changes.append(change)
+
+    def full_messages(self):
+        """The prefix and the user's turns as one list of messages"""
+        if self.prefix is None:
+            return list(self.messages)
+        return self.prefix.messages(self.system_suffix) + self.messages
+
+    def encode_messages(self, end=None):
+        """JSON-encode the prefix and the turns up to ``end`` as the body of a messages array.
+
+        The prefix is spliced in from its pre-encoded bytes; only the user's own
+        turns are serialized.
+        """
+        parts = [json_codec.dumps(message) for message in self.messages[:end]]
+        if self.prefix is not None:
+            parts.insert(0, self.prefix.encode(self.system_suffix))
+        return b", ".join(parts)
+
+    def append(self, message):
+        tokens = self.estimator.count_message(message)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.total_tokens += tokens
+        self.unlogged_changes.append({"op": "append", "message": message})
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def pop(self, index=-1):
+        length = len(self.messages)
+        message = self.messages.pop(index)
+        offset = length - (index % length)
+        self.total_tokens -= self.token_counts.pop(index)
+        self.unlogged_changes.append({"op": "pop", "offset": offset})
+        return message
+
+    def set_content(self, index, content):
+        """Replace the content of a message, keeping the token total in sync"""
+        message = {**self.messages[index], "content": content}
+        tokens = self.estimator.count_message(message)
+        self.total_tokens += tokens - self.token_counts[index]
+        self.messages[index] = message
+        self.token_counts[index] = tokens
+        offset = len(self.messages) - (index % len(self.messages))
+        self.unlogged_changes.append({"op": "set_content", "offset": offset, "content": content})
+
+    def take_unlogged_changes(self):
+        changes = self.unlogged_changes
+        self.unlogged_changes = []
+        return changes
+
+    def trim(self, max_tokens, target_tokens=None):
+        """Drop the oldest turns once the total exceeds ``max_tokens``; the prefix is always kept.
+
+        Trimming only affects the prompt and is not recorded in the log.
+
+        Messages are removed until the total fits in ``target_tokens`` (defaults
+        to ``max_tokens``), so a lower target trims in larger, less frequent
+        blocks. Returns the number of messages removed.
+        """
+        if self.total_tokens <= max_tokens:
+            return 0
+
+        if target_tokens is None:
+            target_tokens = max_tokens
+        excess = self.total_tokens - target_tokens
+        end = 0
+        while excess > 0 and end < len(self.messages):
+            excess -= self.token_counts[end]
+            end += 1
+
+        if end:
+            self.total_tokens -= sum(self.token_counts[:end])
+            del self.messages[:end]
+            del self.token_counts[:end]
+        return end
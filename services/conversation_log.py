@@ -0,0 +1,86 @@
+# services/conversation_log.py
+
+import asyncio
+import json
+import os
+import re
+import logging
+from utils.background_writer import background_writer
+from config.settings import CHAT_LOGS_DIR
+
+logger = logging.getLogger('discord')
+
+LOG_FILE_PATTERN = re.compile(r"(\d+)_(\d+)\.jsonl?$")
+
+class ConversationLog:
+    """Append-only conversation logs, one JSON Lines file per user session.
+
+    Each line records a single change to the conversation (the prompt prefix set,
+    a message appended, removed or edited), so saving a turn only writes that
+    turn. ``read_session`` replays a log back into the full list of messages.
+    """
+    def __init__(self, log_dir=CHAT_LOGS_DIR):
+        self.log_dir = log_dir
+        self.next_sessions = self._build_session_index()
+
+    def _build_session_index(self):
+        """Scan the log directory once for the highest session number per user"""
+        next_sessions = {}
+        for filename in os.listdir(self.log_dir):
+            match = LOG_FILE_PATTERN.match(filename)
+            if match:
+                user_id, number = match.group(1), int(match.group(2))
+                next_sessions[user_id] = max(next_sessions.get(user_id, 1), number + 1)
+        return next_sessions
+
+    def start_session(self, user_id):
+        """Reserve the next session number for the user"""
+        key = str(user_id)
+        session = self.next_sessions.get(key, 1)
+        self.next_sessions[key] = session + 1
+        return session
+
+    def get_log_path(self, user_id, session):
+        return os.path.join(self.log_dir, f"{user_id}_{session}.jsonl")
+
+    def append(self, user_id, session, changes):
+        """Queue conversation changes to be appended to the session's log file"""
+        if not changes:
+            return
+        lines = "".join(json.dumps(change, ensure_ascii=False) + "\n" for change in changes)
+        background_writer.write(self.get_log_path(user_id, session), lines)
+
+    async def read_session(self, user_id, session):
+        """Rebuild the full message list of a session, including legacy JSON snapshots"""
+        # Waiting for pending appends and reading the file both block, so they run in a thread
+        return await asyncio.to_thread(self._read_session, user_id, session)
+
+    def _read_session(self, user_id, session):
+        background_writer.flush()
+        path = self.get_log_path(user_id, session)
+        if not os.path.exists(path):
+            legacy_path = os.path.join(self.log_dir, f"{user_id}_{session}.json")
+            with open(legacy_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+
+        messages = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    apply_change(messages, json.loads(line))
+        return messages
+
+def apply_change(messages, change):
+    """Apply one logged change to a list of messages"""
+    op = change["op"]
+    if op == "prefix":
+        messages[:change.get("replaces", 0)] = change["messages"]
+    elif op == "append":
+        messages.append(change["message"])
+    elif op == "pop":
+        messages.pop(len(messages) - change["offset"])
+    elif op == "set_content":
+        index = len(messages) - change["offset"]
+        messages[index] = {**messages[index], "content": change["content"]}
+    else:
+        raise ValueError(f"Unknown conversation log operation: {op}")
@@ -1,104 +1,218 @@
 # services/conversation_manager.py
 
+import asyncio
 import json
-import os
-import re
-from collections import defaultdict
+import time
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 import logging
-from config.settings import CHAT_LOGS_DIR, PRELOADS_DIR, AVAILABLE_MODELS, DEFAULT_AI_PARAMS
+from services.conversation import Conversation
+from services.conversation_log import ConversationLog
+from services.conversation_store import ConversationStore
+from services.parameters import ParameterLayers
+from services.personas import PersonaCatalog
+from services.tokenizer import load_token_estimator
+from config.settings import (
+    AVAILABLE_MODELS, DEFAULT_AI_PARAMS, CONTEXT_TRIM_LOW_WATER,
+    CONVERSATION_DB_PATH, STORE_FLUSH_INTERVAL, HEDGE_REQUESTS, HEDGE_FALLBACK_MODEL,
+    CACHE_MAX_USERS, CACHE_MEMORY_BUDGET_MB, CACHE_IDLE_TIMEOUT
+)
+
+# Rough per-message memory overhead (dicts, strings, counts) for cache budgeting
+MESSAGE_OVERHEAD_BYTES = 200
 
 logger = logging.getLogger('discord')
 
 class ConversationManager:
     def __init__(self):
-        self.conversations = defaultdict(list)
+        self.token_estimator = load_token_estimator()
+        self.conversation_log = ConversationLog()
+        self.conversations = defaultdict(self.new_conversation)
         self.last_responses = {}
         self.original_messages = {}
         self.response_message_ids = {}
+        self.response_chunk_ids = {}  # user id -> ids of every message of a reply split across several
         self.reroll_counters = defaultdict(int)  # Keep for logging
-        self.user_params = defaultdict(lambda: DEFAULT_AI_PARAMS.copy())
+        self.parameters = ParameterLayers()
         self.reroll_parameters = defaultdict(dict)
-
-        # Load dialogue configuration
-        self.config, self.ai_personality, self.example_dialogue = self.load_dialogue_from_json()
+        self.reroll_candidates = {}  # response message id -> prefetched re-roll candidates
+        self.pending_reroll_candidates = {}  # user id -> candidates awaiting a response message id
+
+        # Persistent store; users are loaded on first access and written back in batches.
+        # Loaded users are kept in least-recently-used order with their last access time.
+        self.store = ConversationStore() if CONVERSATION_DB_PATH else None
+        self.loaded_users = OrderedDict()
+        self.dirty_users = set()
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+
+        # Cache eviction state
+        self.pinned_users = defaultdict(int)  # user id -> generations in progress
+        self.evicting = {}  # user id -> state being written out
+        self.eviction_task = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rehydrations = 0
+        self.evictions = 0
+
+        # Load every persona once; conversations refer to them by id
+        self.personas = PersonaCatalog(self.token_estimator)
+        if self.store is not None:
+            self.personas.assignments.update(self.store.load_persona_assignments())
+
+        # Context trimming statistics
+        self.trim_checks = 0
+        self.prefix_changes = 0
+        self.trimmed_messages = 0
 
         # Get current model's context limit
         self.current_token_limit = AVAILABLE_MODELS.get(DEFAULT_AI_PARAMS.get("model", "magnum-72b"), 16384)
 
-    def load_dialogue_from_json(self, file_name='example_dialogue.json'):
-        file_path = os.path.join(PRELOADS_DIR, file_name)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-
-            if not isinstance(data, dict) or 'config' not in data:
-                raise ValueError("Invalid JSON structure. Expected 'config' key.")
-
-            config = data.get('config', {})
-            ai_personality = data.get('ai_personality', "")
-            dialogue = data.get('dialogue', [])
-
-            if not isinstance(config, dict) or 'load_example_dialogue' not in config:
-                raise ValueError("Invalid config structure. Expected 'load_example_dialogue' key.")
-
-            if not isinstance(dialogue, list):
-                raise ValueError("Invalid dialogue format")
-
-            return config, ai_personality, dialogue
-        except Exception as e:
-            logger.error(f"Error loading dialogue: {str(e)}", extra={'user_id': 'N/A', 'command': 'load_dialogue_from_json'})
-            return {'load_example_dialogue': False}, "You are a helpful assistant.", []
+    def new_conversation(self, messages=None):
+        return Conversation(self.token_estimator, messages)
 
     def get_conversation(self, user_id):
+        self._load_user(user_id)
         return self.conversations[user_id]
 
-    def get_ai_personality(self):
-        return self.ai_personality
+    def get_prompt_prefix(self):
+        """The default persona"""
+        return self.personas.default
+
+    def resolve_persona(self, channel_id=None, guild_id=None):
+        """The persona assigned to the channel, or else its guild, or else the default"""
+        return self.personas.resolve(channel_id, guild_id)
 
-    def get_example_dialogue(self):
-        return self.example_dialogue
+    def set_prefix(self, user_id, prefix, system_suffix=""):
+        """Switch the user's conversation to ``prefix``, keeping their turns"""
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+        history = self.conversations[user_id]
+        if history.prefix is not None and (history.prefix is not prefix or history.system_suffix != system_suffix):
+            # The encoded prompt prefix changes, so the API's prompt cache can't be reused
+            self.prefix_changes += 1
+        history.set_prefix(prefix, system_suffix)
 
-    def should_load_example_dialogue(self):
-        return self.config.get('load_example_dialogue', False)
+    async def assign_persona(self, scope, scope_id, persona_id):
+        """Use a persona in a channel or guild from the next message on; raises KeyError if it is unknown"""
+        self.personas.assign(scope, scope_id, persona_id)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save_persona_assignment, scope, scope_id, persona_id)
 
     def set_last_response(self, user_id, response):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         self.last_responses[user_id] = response
 
     def get_last_response(self, user_id):
+        self._load_user(user_id)
         return self.last_responses.get(user_id)
 
     def save_original_message(self, user_id, message):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         self.original_messages[user_id] = message
 
     def get_original_message(self, user_id):
+        self._load_user(user_id)
         return self.original_messages.get(user_id, "")
 
     def save_response_message_id(self, user_id, message_id):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+
+        # Move prefetched candidates over to the new response message
+        candidates = self.pending_reroll_candidates.pop(user_id, None)
+        previous_id = self.response_message_ids.get(user_id)
+        if previous_id is not None:
+            previous_candidates = self.reroll_candidates.pop(previous_id, None)
+            if candidates is None:
+                candidates = previous_candidates
+        if candidates:
+            self.reroll_candidates[message_id] = candidates
+
         self.response_message_ids[user_id] = message_id
+        self.response_chunk_ids.pop(user_id, None)
+
+    def save_response_messages(self, user_id, message_ids):
+        """Save the ids of every message a reply was split across, in order; the last one has the buttons"""
+        self.save_response_message_id(user_id, message_ids[-1])
+        if len(message_ids) > 1:
+            self.response_chunk_ids[user_id] = list(message_ids)
 
     def get_response_message_id(self, user_id):
+        self._load_user(user_id)
         return self.response_message_ids.get(user_id)
 
+    def get_response_messages(self, user_id):
+        """Ids of the messages holding the user's last reply, in order"""
+        self._load_user(user_id)
+        message_ids = self.response_chunk_ids.get(user_id)
+        if message_ids:
+            return list(message_ids)
+        message_id = self.response_message_ids.get(user_id)
+        return [message_id] if message_id is not None else []
+
+    def store_reroll_candidates(self, user_id, candidates, temperature, message_id=None):
+        """Buffer spare responses for instant re-rolls.
+
+        Without a ``message_id`` the candidates are held until the reply they belong
+        to has been sent and its id is saved with ``save_response_message_id``.
+        """
+        entry = {"temperature": temperature, "candidates": list(candidates)}
+        if message_id is None:
+            self.pending_reroll_candidates[user_id] = entry
+        else:
+            self.reroll_candidates[message_id] = entry
+
+    def pop_reroll_candidate(self, user_id, temperature):
+        """Take a buffered re-roll candidate sampled at ``temperature``, if any"""
+        self._load_user(user_id)
+        message_id = self.response_message_ids.get(user_id)
+        entry = self.reroll_candidates.get(message_id)
+        if not entry or abs(entry["temperature"] - temperature) > 1e-6:
+            return None
+
+        candidate = entry["candidates"].pop(0)
+        if not entry["candidates"]:
+            del self.reroll_candidates[message_id]
+        return candidate
+
+    def clear_reroll_candidates(self, user_id):
+        self._load_user(user_id)
+        self.pending_reroll_candidates.pop(user_id, None)
+        message_id = self.response_message_ids.get(user_id)
+        if message_id is not None:
+            self.reroll_candidates.pop(message_id, None)
+
     def increment_reroll(self, user_id):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         self.reroll_counters[user_id] += 1
 
     def save_reroll_parameters(self, user_id, parameters):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         self.reroll_parameters[user_id] = parameters.copy()
 
     def reset_reroll_parameters(self, user_id):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         if user_id in self.reroll_parameters:
             original_params = self.reroll_parameters[user_id]
             # Update user-specific parameters instead of global
-            self.user_params[user_id].update(original_params)
+            self.parameters.update_overrides(user_id, original_params)
             del self.reroll_parameters[user_id]
 
     def update_last_response(self, user_id, new_response):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
         history = self.conversations[user_id]
         
         # Find and update the last assistant message
         for i in reversed(range(len(history))):
             if history[i]['role'] == 'assistant':
-                history[i]['content'] = new_response
+                history.set_content(i, new_response)
                 break
         else:
             # If no assistant message found, append new one
@@ -107,38 +221,331 @@ class ConversationManager:
         # Update the last_responses cache
         self.last_responses[user_id] = new_response
 
-    @staticmethod
-    def estimate_tokens(message: str) -> int:
-        return len(message) // 4  # Rough estimation
+    def estimate_tokens(self, message: str) -> int:
+        return self.token_estimator.count(message)
+
+    def get_context_limit(self, user_id):
+        """Context size the user's conversation has to fit, including a hedged request's fallback model"""
+        self._load_user(user_id)
+        limit = AVAILABLE_MODELS.get(self.parameters.get(user_id).get("model"), self.current_token_limit)
+        if HEDGE_REQUESTS and HEDGE_FALLBACK_MODEL:
+            limit = min(limit, AVAILABLE_MODELS.get(HEDGE_FALLBACK_MODEL, limit))
+        return limit
+
+    def get_token_budget(self, user_id):
+        """Tokens available for the prompt, leaving room for the reply within the model's context"""
+        self._load_user(user_id)
+        max_tokens = self.parameters.get(user_id).get("max_tokens") or 0
+        return max(0, self.get_context_limit(user_id) - max_tokens)
 
     def manage_conversation_length(self, user_id):
+        self._load_user(user_id)
         history = self.conversations[user_id]
-        total_tokens = sum(self.estimate_tokens(msg["content"]) for msg in history)
 
-        # Ensure the system message and pre-loaded conversation are not trimmed
-        preloaded_length = len(self.example_dialogue) + 1 if self.should_load_example_dialogue() else 1
-
-        while total_tokens > self.current_token_limit and len(history) > preloaded_length:
-            removed_msg = history.pop(preloaded_length)
-            total_tokens -= self.estimate_tokens(removed_msg["content"])
+        # Trim in blocks down to the low-water mark so the prompt prefix stays stable.
+        # The system message and pre-loaded conversation are never trimmed.
+        budget = self.get_token_budget(user_id)
+        removed = history.trim(budget, int(budget * CONTEXT_TRIM_LOW_WATER))
+
+        self.trim_checks += 1
+        if removed:
+            self.prefix_changes += 1
+            self.trimmed_messages += removed
+            self._mark_dirty(user_id)
+
+    def _load_user(self, user_id):
+        """Load the user's stored state the first time they are accessed"""
+        if self.store is None:
+            return
+
+        now = time.monotonic()
+        if user_id in self.loaded_users:
+            self.loaded_users[user_id] = now
+            self.loaded_users.move_to_end(user_id)
+            return
+
+        self.loaded_users[user_id] = now
+
+        # A user evicted a moment ago may not have reached the store yet
+        state = self.evicting.get(user_id)
+        if state is None:
+            try:
+                state = self.store.load_user(user_id)
+            except Exception as e:
+                logger.error(f"Error loading stored conversation: {str(e)}", 
+                            extra={'user_id': user_id, 'command': 'load_user'})
+        if state is not None:
+            self._import_user(user_id, state)
+            self.rehydrations += 1
+
+        if CACHE_MAX_USERS and len(self.loaded_users) > CACHE_MAX_USERS:
+            self._schedule_eviction()
+
+    def _import_user(self, user_id, state):
+        conversation = self._conversation_from_stored(json.loads(state["messages"]))
+        conversation.take_unlogged_changes()  # Already in the log
+        conversation.log_session = state["log_session"]
+        self.conversations[user_id] = conversation
+
+        if state["params"] is not None:
+            self.parameters.set_overrides(user_id, json.loads(state["params"]))
+        if state["last_response"] is not None:
+            self.last_responses[user_id] = state["last_response"]
+        if state["original_message"] is not None:
+            self.original_messages[user_id] = state["original_message"]
+        if state["response_message_id"] is not None:
+            self.response_message_ids[user_id] = state["response_message_id"]
+        if state["response_chunk_ids"] is not None:
+            self.response_chunk_ids[user_id] = json.loads(state["response_chunk_ids"])
+        if state["reroll_parameters"] is not None:
+            self.reroll_parameters[user_id] = json.loads(state["reroll_parameters"])
+        if state["reroll_count"]:
+            self.reroll_counters[user_id] = state["reroll_count"]
+
+    def _conversation_from_stored(self, stored):
+        """Rebuild a stored conversation around the shared persona it refers to"""
+        if isinstance(stored, dict):
+            prefix_id = stored.get("prefix_id")
+            prefix = self.personas.get(prefix_id) if prefix_id is not None else None
+            return Conversation(self.token_estimator, stored["turns"], prefix, stored.get("system_suffix", ""))
+
+        # Older rows hold the full message list, starting with their own copy of the prefix
+        if not stored or stored[0].get("role") != "system":
+            return self.new_conversation(stored)
+        system_content = stored[0].get("content") or ""
+        persona = self.personas.default
+        personality = persona.personality
+        suffix = system_content[len(personality):] if system_content.startswith(personality) else ""
+        turns = stored[1:]
+        dialogue = [dict(message) for message in persona.dialogue]
+        if dialogue and turns[:len(dialogue)] == dialogue:
+            turns = turns[len(dialogue):]
+        return Conversation(self.token_estimator, turns, persona, suffix)
+
+    def _export_user(self, user_id):
+        conversation = self.conversations.get(user_id)
+        params = self.parameters.get_overrides(user_id) or None
+        reroll_parameters = self.reroll_parameters.get(user_id)
+        chunk_ids = self.response_chunk_ids.get(user_id)
+        stored = {
+            "prefix_id": conversation.prefix.id if conversation and conversation.prefix else None,
+            "system_suffix": conversation.system_suffix if conversation else "",
+            "turns": conversation.messages if conversation else [],
+        }
+        return {
+            "messages": json.dumps(stored, ensure_ascii=False),
+            "log_session": conversation.log_session if conversation else None,
+            "params": json.dumps(params, ensure_ascii=False) if params is not None else None,
+            "last_response": self.last_responses.get(user_id),
+            "original_message": self.original_messages.get(user_id),
+            "response_message_id": self.response_message_ids.get(user_id),
+            "response_chunk_ids": json.dumps(chunk_ids) if chunk_ids else None,
+            "reroll_parameters": json.dumps(reroll_parameters) if reroll_parameters else None,
+            "reroll_count": self.reroll_counters.get(user_id, 0),
+        }
+
+    def _drop_user(self, user_id):
+        """Forget everything held in memory for the user"""
+        self.pending_reroll_candidates.pop(user_id, None)
+        self.reroll_candidates.pop(self.response_message_ids.get(user_id), None)
+        for state in (self.conversations, self.last_responses, self.original_messages, self.response_message_ids,
+                      self.response_chunk_ids, self.reroll_counters, self.reroll_parameters):
+            state.pop(user_id, None)
+        self.parameters.drop_user(user_id)
+        self.loaded_users.pop(user_id, None)
+        self.dirty_users.discard(user_id)
+
+    def _estimate_user_size(self, user_id):
+        """Approximate memory held for the user, in bytes, leaving out the shared persona"""
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            return MESSAGE_OVERHEAD_BYTES
+        turn_tokens = conversation.total_tokens - conversation.prefix_tokens
+        return turn_tokens * 4 + len(conversation.system_suffix) + (len(conversation) + 1) * MESSAGE_OVERHEAD_BYTES
+
+    def _estimate_shared_size(self):
+        """Approximate memory held once for every persona, in bytes"""
+        return sum(
+            2 * (len(persona.encoded_system_start) + len(persona.encoded_dialogue)) + len(persona) * MESSAGE_OVERHEAD_BYTES
+            for persona in self.personas.personas.values()
+        )
+
+    @contextmanager
+    def pinned(self, user_id):
+        """Keep the user in memory while a generation holds a reference to their history.
+
+        Each generation counts once as a cache hit or miss, however many times it
+        reads the user's state.
+        """
+        if self.store is not None:
+            if user_id in self.loaded_users:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+            self._load_user(user_id)
+        self.pinned_users[user_id] += 1
+        try:
+            yield
+        finally:
+            self.pinned_users[user_id] -= 1
+            if not self.pinned_users[user_id]:
+                del self.pinned_users[user_id]
+
+    def _select_eviction_victims(self):
+        """Pick idle users, then least recently used users until the cache fits its limits"""
+        now = time.monotonic()
+        candidates = [user_id for user_id in self.loaded_users if user_id not in self.pinned_users]
+        victims = []
+
+        if CACHE_IDLE_TIMEOUT:
+            for user_id in candidates:
+                if now - self.loaded_users[user_id] < CACHE_IDLE_TIMEOUT:
+                    break
+                victims.append(user_id)
+        remaining = candidates[len(victims):]
+
+        excess_users = len(self.loaded_users) - len(victims) - CACHE_MAX_USERS if CACHE_MAX_USERS else 0
+        budget = CACHE_MEMORY_BUDGET_MB * 1024 * 1024
+        excess_bytes = 0
+        if budget:
+            victim_set = set(victims)
+            excess_bytes = self._estimate_shared_size() + sum(
+                self._estimate_user_size(user_id) for user_id in self.loaded_users if user_id not in victim_set
+            ) - budget
+
+        for user_id in remaining:
+            if excess_users <= 0 and excess_bytes <= 0:
+                break
+            victims.append(user_id)
+            excess_users -= 1
+            excess_bytes -= self._estimate_user_size(user_id)
+
+        return victims
+
+    async def evict(self):
+        """Write idle and least recently used users to the store and drop them from memory"""
+        if self.store is None:
+            return
+        # Never alongside a flush, which could write an older snapshot of the same users last
+        async with self.flush_lock:
+            await self._evict()
+
+    async def _evict(self):
+        victims = self._select_eviction_victims()
+        if not victims:
+            return
+
+        states = {user_id: self._export_user(user_id) for user_id in victims}
+        for user_id in victims:
+            self._drop_user(user_id)
+        self.evicting.update(states)
+        self.evictions += len(victims)
 
-    def get_next_log_number(self, user_id: int) -> int:
-        pattern = re.compile(f"{user_id}_(\\d+)\\.json")
-        max_number = 0
-        for filename in os.listdir(CHAT_LOGS_DIR):
-            match = pattern.match(filename)
-            if match:
-                number = int(match.group(1))
-                max_number = max(max_number, number)
-        return max_number + 1
+        try:
+            await asyncio.to_thread(self.store.save_users, states)
+        except Exception as e:
+            logger.error(f"Error saving evicted conversations: {str(e)}", 
+                        extra={'user_id': 'N/A', 'command': 'evict'})
+            # Keep the state in memory rather than losing it
+            for user_id, state in states.items():
+                if user_id not in self.loaded_users:
+                    self.loaded_users[user_id] = time.monotonic()
+                    self.loaded_users.move_to_end(user_id, last=False)
+                    self._import_user(user_id, state)
+                    self.dirty_users.add(user_id)
+        finally:
+            for user_id, state in states.items():
+                if self.evicting.get(user_id) is state:
+                    del self.evicting[user_id]
+
+    def _schedule_eviction(self):
+        if self.eviction_task is None or self.eviction_task.done():
+            try:
+                self.eviction_task = asyncio.get_running_loop().create_task(self.evict())
+            except RuntimeError:
+                pass  # No running event loop; the periodic task will catch up
+
+    def _mark_dirty(self, user_id):
+        if self.store is not None:
+            self.dirty_users.add(user_id)
+
+    async def flush(self):
+        """Write the state of users changed since the last flush to the store"""
+        if self.store is None:
+            return
+        async with self.flush_lock:
+            if not self.dirty_users:
+                return
+            # Snapshot on the event loop, write on a worker thread
+            states = {user_id: self._export_user(user_id) for user_id in self.dirty_users}
+            self.dirty_users.clear()
+            try:
+                await asyncio.to_thread(self.store.save_users, states)
+            except Exception as e:
+                self.dirty_users.update(states)
+                logger.error(f"Error saving conversations: {str(e)}", 
+                            extra={'user_id': 'N/A', 'command': 'flush'})
+
+    async def _persist_periodically(self):
+        while True:
+            await asyncio.sleep(STORE_FLUSH_INTERVAL)
+            await self.flush()
+            await self.evict()
+
+    def start_persistence(self):
+        """Start the write-behind flush and cache eviction loop"""
+        if self.store is not None and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._persist_periodically())
+
+    async def close(self):
+        """Flush pending changes and close the store"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.store is not None:
+            await self.flush()
+            self.store.close()
+
+    def get_metrics(self):
+        """Collect conversation metrics, grouped by component"""
+        return {
+            "context_trimming": {
+                "checks": self.trim_checks,
+                "prefix_changes": self.prefix_changes,
+                "prefix_change_rate": round(self.prefix_changes / self.trim_checks, 4) if self.trim_checks else 0.0,
+                "trimmed_messages": self.trimmed_messages,
+            },
+            "store": {
+                **(self.store.get_metrics() if self.store is not None else {"path": None}),
+                "dirty_users": len(self.dirty_users),
+            },
+            "cache": {
+                "loaded_users": len(self.loaded_users),
+                "estimated_mb": round(sum(self._estimate_user_size(u) for u in self.loaded_users) / (1024 * 1024), 2),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / (self.cache_hits + self.cache_misses), 4)
+                if self.cache_hits + self.cache_misses else 0.0,
+                "rehydrations": self.rehydrations,
+                "evictions": self.evictions,
+            },
+            "personas": self.personas.get_metrics(),
+        }
 
     def save_conversation_log(self, user_id):
-        log_number = self.get_next_log_number(user_id)
-        log_file = os.path.join(CHAT_LOGS_DIR, f"{user_id}_{log_number}.json")
+        """Append the conversation's changes since the last save to the user's session log"""
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+        history = self.conversations[user_id]
+        changes = history.take_unlogged_changes()
+        if not changes:
+            return
+
+        if history.log_session is None:
+            history.log_session = self.conversation_log.start_session(user_id)
         try:
-            with open(log_file, 'w', encoding='utf-8') as file:
-                json.dump(self.conversations[user_id], file, indent=2, ensure_ascii=False)
-            logger.info(f"Conversation log saved: {log_file}", 
+            self.conversation_log.append(user_id, history.log_session, changes)
+            logger.info(f"Conversation log saved: {self.conversation_log.get_log_path(user_id, history.log_session)}", 
                        extra={'user_id': user_id, 'command': 'save_conversation_log'})
         except Exception as e:
             logger.error(f"Error saving conversation log: {str(e)}", 
@@ -146,35 +553,55 @@ class ConversationManager:
 
     def clear_history(self, user_id):
         """Clear user's conversation history while maintaining structure"""
-        # Create a new conversation list with just the system message
-        new_history = []
-        
-        # Add system message
-        system_message = {"role": "system", "content": self.ai_personality}
-        new_history.append(system_message)
-        
-        # Add example dialogue if enabled
-        if self.should_load_example_dialogue():
-            new_history.extend(self.example_dialogue)
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+        # Create a new conversation with just the shared system message and example dialogue
+        # of the persona it was using
+        old_history = self.conversations.get(user_id)
+        new_history = self.new_conversation()
+        new_history.set_prefix(old_history.prefix if old_history and old_history.prefix else self.personas.default)
+        if old_history and old_history.prefix and (
+            old_history.prefix is not new_history.prefix or old_history.system_suffix != new_history.system_suffix
+        ):
+            self.prefix_changes += 1
         
         # Set the new conversation
         self.conversations[user_id] = new_history
         
         # Clear other user-specific data
+        self.clear_reroll_candidates(user_id)
         if user_id in self.last_responses:
             del self.last_responses[user_id]
         if user_id in self.original_messages:
             del self.original_messages[user_id]
         if user_id in self.response_message_ids:
             del self.response_message_ids[user_id]
+        if user_id in self.response_chunk_ids:
+            del self.response_chunk_ids[user_id]
         if user_id in self.reroll_counters:
             del self.reroll_counters[user_id]
         if user_id in self.reroll_parameters:
             del self.reroll_parameters[user_id]
 
     def get_user_params(self, user_id):
-        return self.user_params[user_id]
+        """Read-only generation parameters for the user: the current preset plus their overrides"""
+        self._load_user(user_id)
+        return self.parameters.get(user_id)
+
+    def get_request_params(self, user_id):
+        """The user's parameters as sent to the API, without values matching the server defaults"""
+        self._load_user(user_id)
+        return self.parameters.get_request_params(user_id)
+
+    def update_user_params(self, user_id, params):
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+        self.parameters.update_overrides(user_id, params)
 
     def set_conversation(self, user_id, history):
         """Set the full conversation history for a user"""
+        self._load_user(user_id)
+        self._mark_dirty(user_id)
+        if not isinstance(history, Conversation):
+            history = self.new_conversation(history)
         self.conversations[user_id] = history
@@ -0,0 +1,149 @@
+# services/conversation_store.py
+
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import logging
+from config.settings import CONVERSATION_DB_PATH
+
+logger = logging.getLogger('discord')
+
+# Statements are kept as constants so sqlite3's statement cache reuses them
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY,
+    messages TEXT NOT NULL,
+    log_session INTEGER,
+    params TEXT,
+    last_response TEXT,
+    original_message TEXT,
+    response_message_id INTEGER,
+    response_chunk_ids TEXT,
+    reroll_parameters TEXT,
+    reroll_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+"""
+SELECT_USER_SQL = """
+SELECT messages, log_session, params, last_response, original_message,
+       response_message_id, response_chunk_ids, reroll_parameters, reroll_count
+FROM user_state WHERE user_id = ?
+"""
+UPSERT_USER_SQL = """
+INSERT INTO user_state (
+    user_id, messages, log_session, params, last_response, original_message,
+    response_message_id, response_chunk_ids, reroll_parameters, reroll_count, updated_at
+) VALUES (
+    :user_id, :messages, :log_session, :params, :last_response, :original_message,
+    :response_message_id, :response_chunk_ids, :reroll_parameters, :reroll_count, :updated_at
+)
+ON CONFLICT(user_id) DO UPDATE SET
+    messages = excluded.messages,
+    log_session = excluded.log_session,
+    params = excluded.params,
+    last_response = excluded.last_response,
+    original_message = excluded.original_message,
+    response_message_id = excluded.response_message_id,
+    response_chunk_ids = excluded.response_chunk_ids,
+    reroll_parameters = excluded.reroll_parameters,
+    reroll_count = excluded.reroll_count,
+    updated_at = excluded.updated_at
+"""
+CREATE_PERSONAS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS persona_assignments (
+    scope TEXT NOT NULL,
+    scope_id INTEGER NOT NULL,
+    persona_id TEXT NOT NULL,
+    PRIMARY KEY (scope, scope_id)
+)
+"""
+SELECT_PERSONAS_SQL = "SELECT scope, scope_id, persona_id FROM persona_assignments"
+UPSERT_PERSONA_SQL = """
+INSERT INTO persona_assignments (scope, scope_id, persona_id) VALUES (?, ?, ?)
+ON CONFLICT(scope, scope_id) DO UPDATE SET persona_id = excluded.persona_id
+"""
+STATE_COLUMNS = (
+    "messages", "log_session", "params", "last_response", "original_message",
+    "response_message_id", "response_chunk_ids", "reroll_parameters", "reroll_count"
+)
+# Columns added after the first release, created on older databases at startup
+ADDED_COLUMNS = {"response_chunk_ids": "TEXT"}
+
+class ConversationStore:
+    """SQLite-backed storage of per-user conversation state.
+
+    Each user is one row; list and dict fields are stored as JSON text. Persona
+    assignments for channels and guilds are kept in a second table. The
+    database runs in WAL mode and reads go through their own read-only
+    connection, so loading a user never waits on a write-behind flush.
+    """
+    def __init__(self, path=CONVERSATION_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, cached_statements=32)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(CREATE_TABLE_SQL)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(user_state)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE user_state ADD COLUMN {column} {column_type}")
+        self.connection.execute(CREATE_PERSONAS_TABLE_SQL)
+        self.connection.commit()
+
+        self.read_lock = threading.Lock()
+        self.read_connection = sqlite3.connect(
+            pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False
+        )
+
+        self.reads = 0
+        self.writes = 0
+
+    def load_user(self, user_id):
+        """Return the stored state for the user as a dict, or None"""
+        with self.read_lock:
+            row = self.read_connection.execute(SELECT_USER_SQL, (user_id,)).fetchone()
+        self.reads += 1
+        if row is None:
+            return None
+        return dict(zip(STATE_COLUMNS, row))
+
+    def save_users(self, states):
+        """Insert or update several users' states in one transaction"""
+        now = time.time()
+        rows = [{**state, "user_id": user_id, "updated_at": now} for user_id, state in states.items()]
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(UPSERT_USER_SQL, rows)
+        self.writes += len(rows)
+
+    def load_persona_assignments(self):
+        """Return the stored persona assignments as {(scope, scope id): persona id}"""
+        with self.read_lock:
+            rows = self.read_connection.execute(SELECT_PERSONAS_SQL).fetchall()
+        return {(scope, scope_id): persona_id for scope, scope_id, persona_id in rows}
+
+    def save_persona_assignment(self, scope, scope_id, persona_id):
+        with self.lock:
+            with self.connection:
+                self.connection.execute(UPSERT_PERSONA_SQL, (scope, scope_id, persona_id))
+        self.writes += 1
+
+    def close(self):
+        with self.read_lock:
+            self.read_connection.close()
+        with self.lock:
+            self.connection.close()
+
+    def get_metrics(self):
+        return {
+            "path": self.path,
+            "reads": self.reads,
+            "writes": self.writes,
+        }
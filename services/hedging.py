@@ -0,0 +1,77 @@
+# services/hedging.py
+
+import math
+import logging
+from collections import deque
+from config.settings import (
+    AVAILABLE_MODELS, HEDGE_REQUESTS, HEDGE_FALLBACK_MODEL, HEDGE_PERCENTILE, HEDGE_DELAY, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES
+)
+
+logger = logging.getLogger('discord')
+
+class LatencyTracker:
+    """Sliding window of recent request latencies"""
+    def __init__(self, size=500):
+        self.samples = deque(maxlen=size)
+
+    def record(self, latency):
+        self.samples.append(latency)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+class HedgePolicy:
+    """Decides when to send a second, hedged request and to which model.
+
+    Latency is measured until a request first delivers something: the first
+    streamed tokens, or the whole reply when not streaming. Streamed and
+    non-streamed requests are tracked separately since their latencies differ.
+    Once enough samples exist, a request that is slower than the tracked
+    ``HEDGE_PERCENTILE`` is hedged; until then ``HEDGE_DELAY`` is used.
+    """
+    def __init__(self, enabled=HEDGE_REQUESTS, fallback_model=HEDGE_FALLBACK_MODEL):
+        self.enabled = enabled
+        self.fallback_model = fallback_model or None
+        self.trackers = {False: LatencyTracker(), True: LatencyTracker()}
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        if self.enabled and self.fallback_model and self.fallback_model not in AVAILABLE_MODELS:
+            logger.warning(f"Hedge fallback model '{self.fallback_model}' is not in AVAILABLE_MODELS", 
+                          extra={'user_id': 'N/A', 'command': 'hedging'})
+
+    def record(self, stream, latency):
+        self.trackers[stream].record(latency)
+
+    def delay(self, stream):
+        """Seconds to wait for the first request before hedging"""
+        tracker = self.trackers[stream]
+        if len(tracker.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY
+        return max(HEDGE_MIN_DELAY, tracker.percentile(HEDGE_PERCENTILE))
+
+    def hedge_model(self, model):
+        """The model the hedged request goes to"""
+        return self.fallback_model or model
+
+    def get_metrics(self):
+        metrics = {
+            "enabled": self.enabled,
+            "fallback_model": self.fallback_model,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+        }
+        for stream, name in ((False, "complete"), (True, "first_token")):
+            tracker = self.trackers[stream]
+            p50 = tracker.percentile(50)
+            p95 = tracker.percentile(95)
+            metrics[f"{name}_latency"] = {
+                "samples": len(tracker.samples),
+                "p50": round(p50, 3) if p50 is not None else None,
+                "p95": round(p95, 3) if p95 is not None else None,
+                "hedge_delay": round(self.delay(stream), 3),
+            }
+        return metrics
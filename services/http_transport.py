@@ -0,0 +1,130 @@
+# services/http_transport.py
+
+import asyncio
+import time
+import logging
+import aiohttp
+from config.settings import (
+    API_URL, HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_TTL,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_TOTAL_TIMEOUT,
+    HTTP_PREWARM_CONNECTIONS, HTTP_KEEPALIVE_INTERVAL
+)
+
+logger = logging.getLogger('discord')
+
+class HttpTransport:
+    """A tuned, pre-warmed aiohttp connection pool for the completion API.
+
+    Idle connections are kept open for ``HTTP_KEEPALIVE_TIMEOUT`` seconds and DNS
+    answers are cached, so most requests reuse an established TLS connection.
+    ``prewarm`` opens connections ahead of the first request, and a keep-alive
+    loop touches the endpoint whenever the bot has been idle for a while.
+    """
+    def __init__(self, url=API_URL):
+        self.url = url
+        self.session = None
+        self.keepalive_task = None
+        self.last_used = 0.0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.prewarmed = 0
+        self.keepalive_pings = 0
+        self.keepalive_failures = 0
+
+    def create_session(self):
+        """Create the shared client session with the configured pool and timeouts"""
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_TTL,
+        )
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.request_timeout(),
+            trace_configs=[trace_config],
+        )
+        return self.session
+
+    async def _on_connection_created(self, session, context, params):
+        self.connections_created += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+    def request_timeout(self, custom_timeout=None):
+        """Connect/read/total timeouts for a request.
+
+        ``custom_timeout`` is how long the API may spend on the generation, so the
+        read and total timeouts are extended to never give up before the server does.
+        """
+        sock_read = HTTP_READ_TIMEOUT
+        total = HTTP_TOTAL_TIMEOUT
+        if custom_timeout:
+            sock_read = max(sock_read, custom_timeout)
+            total = max(total, custom_timeout + HTTP_CONNECT_TIMEOUT)
+        return aiohttp.ClientTimeout(total=total, connect=HTTP_CONNECT_TIMEOUT, sock_read=sock_read)
+
+    def mark_used(self):
+        self.last_used = time.monotonic()
+
+    async def _touch(self):
+        """Send a lightweight request so a pooled connection is opened or kept alive"""
+        async with self.session.head(self.url, timeout=self.request_timeout()) as response:
+            await response.read()
+
+    async def prewarm(self, count=HTTP_PREWARM_CONNECTIONS):
+        """Open ``count`` connections to the API ahead of the first request"""
+        if self.session is None or count <= 0:
+            return
+        results = await asyncio.gather(*(self._touch() for _ in range(count)), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        self.prewarmed += len(results) - len(failures)
+        if failures:
+            logger.warning(f"Failed to pre-warm {len(failures)} of {count} API connections: {str(failures[0])}", 
+                          extra={'user_id': 'N/A', 'command': 'prewarm'})
+        self.mark_used()
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(HTTP_KEEPALIVE_INTERVAL)
+            if time.monotonic() - self.last_used < HTTP_KEEPALIVE_INTERVAL:
+                continue
+            try:
+                await self._touch()
+                self.keepalive_pings += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.keepalive_failures += 1
+                logger.warning(f"API keep-alive failed: {str(e)}", 
+                              extra={'user_id': 'N/A', 'command': 'keep_alive'})
+            self.mark_used()
+
+    def start_keepalive(self):
+        """Start touching the API periodically while the bot is idle"""
+        if HTTP_KEEPALIVE_INTERVAL > 0 and self.keepalive_task is None:
+            self.keepalive_task = asyncio.create_task(self._keep_alive())
+
+    def get_metrics(self):
+        created = self.connections_created
+        reused = self.connections_reused
+        return {
+            "connections_created": created,
+            "connections_reused": reused,
+            "reuse_rate": round(reused / (created + reused), 4) if created + reused else 0.0,
+            "prewarmed": self.prewarmed,
+            "keepalive_pings": self.keepalive_pings,
+            "keepalive_failures": self.keepalive_failures,
+        }
+
+    async def close(self):
+        if self.keepalive_task is not None:
+            self.keepalive_task.cancel()
+            self.keepalive_task = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
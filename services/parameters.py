@@ -0,0 +1,111 @@
+# services/parameters.py
+
+import copy
+from types import MappingProxyType
+from config.settings import DEFAULT_AI_PARAMS, SERVER_DEFAULT_PARAMS, PRUNE_DEFAULT_PARAMS
+
+def freeze_params(params):
+    """Return a read-only view of ``params`` with lists turned into tuples"""
+    frozen = {}
+    for key, value in params.items():
+        if isinstance(value, list):
+            value = tuple(value)
+        elif isinstance(value, dict):
+            value = copy.deepcopy(value)
+        frozen[key] = value
+    return MappingProxyType(frozen)
+
+def is_server_default(key, value):
+    """Whether the API would use ``value`` for ``key`` anyway if it were omitted"""
+    if not PRUNE_DEFAULT_PARAMS or key not in SERVER_DEFAULT_PARAMS:
+        return False
+    default = SERVER_DEFAULT_PARAMS[key]
+    if isinstance(value, tuple):
+        value = list(value)
+    return value == default and isinstance(value, bool) == isinstance(default, bool)
+
+def prune_params(params):
+    """Drop parameters that match the API's defaults"""
+    return {key: value for key, value in params.items() if not is_server_default(key, value)}
+
+def apply_request_overrides(request_params, overrides):
+    """Layer per-request overrides over pruned parameters, keeping the result pruned"""
+    request = dict(request_params)
+    for key, value in overrides.items():
+        if is_server_default(key, value):
+            request.pop(key, None)
+        else:
+            request[key] = value
+    return request
+
+class ParameterPreset:
+    """An immutable, versioned set of generation parameters shared by all users.
+
+    ``request_params`` holds the parameters actually sent to the API, with
+    values matching the server defaults pruned once when the preset is created.
+    """
+    def __init__(self, params, name, version):
+        self.params = freeze_params(params)
+        self.request_params = freeze_params(prune_params(self.params))
+        self.name = name
+        self.version = version
+
+class ParameterLayers:
+    """Generation parameters as a shared preset plus small per-user overrides.
+
+    Users only store the keys they changed. The merged parameters for a user are
+    built once per preset version and cached, so switching presets applies to
+    everyone immediately without copying the full parameter set per user.
+    """
+    def __init__(self, base_params=DEFAULT_AI_PARAMS):
+        self.base_params = copy.deepcopy(base_params)
+        self.preset = ParameterPreset(self.base_params, "default", 1)
+        self.overrides = {}
+        self.merged_cache = {}  # user id -> (preset version, merged params, request params)
+
+    def set_preset(self, params, name):
+        """Switch every user to a new preset layered over the base parameters"""
+        self.preset = ParameterPreset({**self.base_params, **params}, name, self.preset.version + 1)
+        self.merged_cache.clear()
+        return self.preset
+
+    def get(self, user_id):
+        """Read-only merged parameters for the user"""
+        return self._merged(user_id)[0]
+
+    def get_request_params(self, user_id):
+        """Read-only merged parameters for the user with server defaults pruned"""
+        return self._merged(user_id)[1]
+
+    def _merged(self, user_id):
+        overrides = self.overrides.get(user_id)
+        if not overrides:
+            return self.preset.params, self.preset.request_params
+
+        cached = self.merged_cache.get(user_id)
+        if cached is not None and cached[0] == self.preset.version:
+            return cached[1], cached[2]
+
+        merged = freeze_params({**self.preset.params, **overrides})
+        request_params = freeze_params(apply_request_overrides(self.preset.request_params, overrides))
+        self.merged_cache[user_id] = (self.preset.version, merged, request_params)
+        return merged, request_params
+
+    def get_overrides(self, user_id):
+        return dict(self.overrides.get(user_id) or {})
+
+    def set_overrides(self, user_id, overrides):
+        """Replace the user's overrides, dropping any that match the preset"""
+        overrides = {k: v for k, v in overrides.items() if self.preset.params.get(k) != v}
+        if overrides:
+            self.overrides[user_id] = overrides
+        else:
+            self.overrides.pop(user_id, None)
+        self.merged_cache.pop(user_id, None)
+
+    def update_overrides(self, user_id, params):
+        self.set_overrides(user_id, {**self.get_overrides(user_id), **params})
+
+    def drop_user(self, user_id):
+        self.overrides.pop(user_id, None)
+        self.merged_cache.pop(user_id, None)
@@ -0,0 +1,99 @@
+# services/personas.py
+
+import json
+import os
+import logging
+from services.prompt_prefix import PromptPrefix
+from config.settings import PRELOADS_DIR, DEFAULT_PERSONA
+
+logger = logging.getLogger('discord')
+
+FALLBACK_PERSONALITY = "You are a helpful assistant."
+PERSONA_SCOPES = ("channel", "guild")
+
+def load_persona(file_path, persona_id):
+    """Read a preload file into a PromptPrefix; raises ValueError if it is malformed"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+
+    if not isinstance(data, dict) or 'config' not in data:
+        raise ValueError("Invalid JSON structure. Expected 'config' key.")
+
+    config = data.get('config', {})
+    ai_personality = data.get('ai_personality', "")
+    dialogue = data.get('dialogue', [])
+
+    if not isinstance(config, dict) or 'load_example_dialogue' not in config:
+        raise ValueError("Invalid config structure. Expected 'load_example_dialogue' key.")
+
+    if not isinstance(dialogue, list):
+        raise ValueError("Invalid dialogue format")
+
+    return PromptPrefix(persona_id, ai_personality, dialogue if config.get('load_example_dialogue') else ())
+
+class PersonaCatalog:
+    """Every persona in the preloads directory, loaded once and shared by all conversations.
+
+    A persona is a ``PromptPrefix`` keyed by its file name without the extension,
+    with its messages pre-encoded and token counts computed at startup, so
+    conversations only store the id. Personas can be assigned to a channel or a
+    guild at runtime; a channel's assignment wins over its guild's, and anything
+    unassigned gets the default persona.
+    """
+    def __init__(self, estimator, directory=PRELOADS_DIR, default_id=DEFAULT_PERSONA):
+        self.personas = {}
+        self.assignments = {}  # (scope, channel or guild id) -> persona id
+
+        try:
+            file_names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            file_names = []
+        for file_name in file_names:
+            persona_id, extension = os.path.splitext(file_name)
+            if extension.lower() != ".json":
+                continue
+            try:
+                persona = load_persona(os.path.join(directory, file_name), persona_id)
+            except Exception as e:
+                logger.error(f"Error loading persona {file_name}: {str(e)}",
+                            extra={'user_id': 'N/A', 'command': 'load_personas'})
+                continue
+            persona.count_tokens(estimator)
+            self.personas[persona_id] = persona
+
+        if default_id not in self.personas:
+            logger.error(f"Default persona '{default_id}' not found in {directory}",
+                        extra={'user_id': 'N/A', 'command': 'load_personas'})
+            self.personas[default_id] = PromptPrefix(default_id, FALLBACK_PERSONALITY)
+        self.default = self.personas[default_id]
+
+    def get(self, persona_id):
+        """The persona with ``persona_id``, or the default one if it no longer exists"""
+        return self.personas.get(persona_id, self.default)
+
+    def resolve(self, channel_id=None, guild_id=None):
+        """The persona used in a channel"""
+        persona_id = self.assignments.get(("channel", channel_id))
+        if persona_id is None:
+            persona_id = self.assignments.get(("guild", guild_id))
+        return self.get(persona_id)
+
+    def assign(self, scope, scope_id, persona_id):
+        """Use ``persona_id`` in a channel or guild from now on"""
+        if scope not in PERSONA_SCOPES:
+            raise ValueError(f"Unknown persona scope '{scope}'")
+        if persona_id not in self.personas:
+            raise KeyError(persona_id)
+        self.assignments[(scope, scope_id)] = persona_id
+
+    def search(self, text, limit=25):
+        """Persona ids containing ``text``, for autocompletion"""
+        text = text.lower()
+        return sorted(persona_id for persona_id in self.personas if text in persona_id.lower())[:limit]
+
+    def get_metrics(self):
+        return {
+            "loaded": len(self.personas),
+            "default": self.default.id,
+            "assignments": len(self.assignments),
+        }
@@ -0,0 +1,181 @@
+# services/preset_registry.py
+
+import asyncio
+import json
+import os
+import logging
+from services.parameters import freeze_params
+from config.settings import DEFAULT_AI_PARAMS, AVAILABLE_MODELS, TEXTGEN_DIR, PRESET_POLL_INTERVAL
+
+logger = logging.getLogger('discord')
+
+class PresetError(Exception):
+    """A preset that doesn't exist or failed validation"""
+
+def param_schema(defaults=DEFAULT_AI_PARAMS):
+    """Allowed value types per parameter, taken from the types of ``defaults``.
+
+    Numbers accept both ints and floats; parameters that default to None accept
+    any JSON value.
+    """
+    schema = {}
+    for key, value in defaults.items():
+        if value is None:
+            schema[key] = None
+        elif isinstance(value, bool):
+            schema[key] = (bool,)
+        elif isinstance(value, (int, float)):
+            schema[key] = (int, float)
+        else:
+            schema[key] = (type(value),)
+    return schema
+
+PARAM_SCHEMA = param_schema()
+
+def validate_params(params, schema=PARAM_SCHEMA):
+    """Return a list of problems with ``params``, empty if they can be sent to the API"""
+    if not isinstance(params, dict):
+        return ["expected a JSON object of parameters"]
+
+    problems = []
+    for key, value in params.items():
+        if key not in schema:
+            problems.append(f"unknown parameter '{key}'")
+            continue
+        allowed = schema[key]
+        if allowed is None or value is None:
+            continue
+        if isinstance(value, bool) != (bool in allowed) or not isinstance(value, allowed):
+            expected = " or ".join(t.__name__ for t in allowed)
+            problems.append(f"'{key}' should be {expected}, not {type(value).__name__}")
+
+    model = params.get("model")
+    if model is not None and model not in AVAILABLE_MODELS:
+        problems.append(f"unknown model '{model}'")
+    return problems
+
+class PresetFile:
+    """A validated parameter preset loaded from the textgen directory"""
+    __slots__ = ("name", "params", "mtime_ns")
+
+    def __init__(self, name, params, mtime_ns):
+        self.name = name
+        self.params = freeze_params(params)
+        self.mtime_ns = mtime_ns
+
+class PresetRegistry:
+    """All parameter presets in ``directory``, parsed and validated up front.
+
+    Files are polled for changes in a worker thread every ``poll_interval``
+    seconds, so the event loop never blocks on disk reads. A scan builds a new
+    preset table that replaces the old one in a single assignment; if the active
+    preset's file changed, the new version is applied to ``parameters`` the same
+    way. Requests already in flight keep the parameters they started with.
+    """
+    def __init__(self, parameters, directory=TEXTGEN_DIR, poll_interval=PRESET_POLL_INTERVAL):
+        self.parameters = parameters
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.presets = {}  # file name -> PresetFile
+        self.errors = {}  # file name -> (mtime, problem description) for invalid files
+        self.poll_task = None
+        self.scans = 0
+        self.reloads = 0
+
+    async def start(self):
+        """Load every preset and start watching the directory for changes"""
+        await self.refresh()
+        for name, (_, problem) in self.errors.items():
+            logger.error(f"Invalid preset {name}: {problem}", extra={'user_id': 'N/A', 'command': 'presets'})
+        logger.info(f"Loaded {len(self.presets)} parameter presets", extra={'user_id': 'N/A', 'command': 'presets'})
+
+        if self.poll_interval > 0 and self.poll_task is None:
+            self.poll_task = asyncio.create_task(self._poll())
+
+    async def refresh(self):
+        """Rescan the directory and swap in the changed presets; returns the names that changed"""
+        presets, errors, changed = await asyncio.to_thread(self._scan, self.presets, self.errors)
+        self.presets, self.errors = presets, errors
+        self.scans += 1
+
+        active = self.parameters.preset.name
+        if active in changed and active in presets:
+            self.parameters.set_preset(presets[active].params, active)
+            self.reloads += 1
+            logger.info(f"Reloaded active preset {active}", extra={'user_id': 'N/A', 'command': 'presets'})
+        return changed
+
+    def _scan(self, presets, errors):
+        """Build new preset tables from disk, re-reading only files whose mtime changed"""
+        new_presets, new_errors, changed = {}, {}, set()
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.lower().endswith(".json")]
+        except FileNotFoundError:
+            entries = []
+
+        for entry in entries:
+            name = entry.name
+            mtime_ns = entry.stat().st_mtime_ns
+            known = presets.get(name)
+            if known is not None and known.mtime_ns == mtime_ns:
+                new_presets[name] = known
+                continue
+            if name in errors and errors[name][0] == mtime_ns:
+                new_errors[name] = errors[name]
+                continue
+
+            changed.add(name)
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as file:
+                    params = json.load(file)
+                problems = validate_params(params)
+            except (OSError, ValueError) as e:
+                problems = [f"not a valid JSON file ({str(e)})"]
+
+            if problems:
+                new_errors[name] = (mtime_ns, "; ".join(problems))
+                if known is not None:
+                    logger.error(f"Invalid preset {name}: {new_errors[name][1]}",
+                                extra={'user_id': 'N/A', 'command': 'presets'})
+            else:
+                new_presets[name] = PresetFile(name, params, mtime_ns)
+
+        changed.update(set(presets) - set(new_presets) - set(new_errors))
+        return new_presets, new_errors, changed
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Preset reload failed: {str(e)}", extra={'user_id': 'N/A', 'command': 'presets'})
+
+    def get(self, name):
+        """The preset called ``name``; raises PresetError if it is missing or invalid"""
+        preset = self.presets.get(name)
+        if preset is not None:
+            return preset
+        if name in self.errors:
+            raise PresetError(f"'{name}' is not a valid preset: {self.errors[name][1]}")
+        raise PresetError(f"File '{name}' not found in the {self.directory} directory.")
+
+    def search(self, text, limit=25):
+        """Names of valid presets containing ``text``, for autocompletion"""
+        text = text.lower()
+        return sorted(name for name in self.presets if text in name.lower())[:limit]
+
+    def get_metrics(self):
+        return {
+            "presets": len(self.presets),
+            "invalid": sorted(self.errors),
+            "active": self.parameters.preset.name,
+            "scans": self.scans,
+            "reloads": self.reloads,
+        }
+
+    async def close(self):
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
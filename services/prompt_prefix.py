@@ -0,0 +1,50 @@
+# services/prompt_prefix.py
+
+from types import MappingProxyType
+from utils import json_codec
+
+class PromptPrefix:
+    """The persona's system prompt and example dialogue, shared by every conversation.
+
+    The messages are stored once as read-only mappings along with their JSON
+    encoding, so conversations only keep their own turns and requests splice in
+    the pre-encoded bytes. A conversation can append a short suffix to the system
+    prompt (e.g. the user's name) without copying the rest of it.
+    """
+    def __init__(self, prefix_id, personality, dialogue=()):
+        self.id = prefix_id
+        self.personality = personality
+        self.dialogue = tuple(
+            MappingProxyType({"role": message["role"], "content": message["content"]}) for message in dialogue
+        )
+
+        # JSON encoders escape characters independently, so an escaped suffix can be
+        # appended to the escaped personality inside the same JSON string
+        self.encoded_system_start = b'{"role": "system", "content": "' + self._escape(personality)
+        self.encoded_dialogue = b"".join(b", " + json_codec.dumps(dict(message)) for message in self.dialogue)
+        self.token_counts = {}
+
+    @staticmethod
+    def _escape(text):
+        return json_codec.dumps(text)[1:-1]
+
+    def __len__(self):
+        return len(self.dialogue) + 1
+
+    def system_message(self, suffix=""):
+        return {"role": "system", "content": self.personality + suffix}
+
+    def messages(self, suffix=""):
+        """The prefix as a list of plain message dicts"""
+        return [self.system_message(suffix)] + [dict(message) for message in self.dialogue]
+
+    def encode(self, suffix=""):
+        """The prefix messages as comma-separated JSON objects"""
+        return self.encoded_system_start + self._escape(suffix) + b'"}' + self.encoded_dialogue
+
+    def count_tokens(self, estimator, suffix=""):
+        """Tokens used by the prefix, with the dialogue counted once per estimator"""
+        key = id(estimator)
+        if key not in self.token_counts:
+            self.token_counts[key] = sum(estimator.count_message(message) for message in self.dialogue)
+        return self.token_counts[key] + estimator.count_message(self.system_message(suffix))
@@ -0,0 +1,166 @@
+# services/rate_limiter.py
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from config.settings import (
+    API_RATE_LIMIT, API_RATE_BURST, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN
+)
+
+def parse_retry_after(headers):
+    """Return the delay in seconds requested by a Retry-After header, or None"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Client-side throttle for API requests that adapts to the server's rate limits.
+
+    Tokens refill at ``rate`` per second up to ``capacity``. Being rate limited halves
+    the rate and pauses all requests until the server's Retry-After has passed;
+    successful requests gradually restore the configured rate.
+    """
+    def __init__(self, rate=API_RATE_LIMIT, capacity=API_RATE_BURST):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self.lock:
+            throttled = False
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+
+                if not throttled:
+                    throttled = True
+                    self.throttled += 1
+                await asyncio.sleep(delay)
+
+    def record_success(self):
+        # Additive increase back towards the configured rate
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def record_rate_limited(self, retry_after=None):
+        """Back off after the server rejected a request for exceeding its rate limit"""
+        now = time.monotonic()
+        self._refill(now)
+        self.rate_limited += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        delay = retry_after if retry_after is not None else 1 / self.rate
+        self.blocked_until = max(self.blocked_until, now + delay)
+
+    def update_from_headers(self, headers):
+        """Pause until the window resets when the server reports no requests remaining"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            if int(float(remaining)) > 0:
+                return
+            reset = float(reset)
+        except ValueError:
+            return
+
+        # The reset header is either a delay in seconds or an epoch timestamp
+        delay = reset - time.time() if reset > 1e9 else reset
+        if delay > 0:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def get_metrics(self):
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+        }
+
+class CircuitBreaker:
+    """Fails requests fast while the upstream model appears to be offline.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and rejects
+    requests for ``cooldown`` seconds, then lets a single probe request through.
+    """
+    def __init__(self, failure_threshold=CIRCUIT_BREAKER_THRESHOLD, cooldown=CIRCUIT_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow_request(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def release_probe(self):
+        """End a probe that finished without an outcome, so the next request can probe again"""
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        was_probe = self.probe_in_flight
+        self.probe_in_flight = False
+        if was_probe or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+    def get_metrics(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,209 @@
+# services/request_dispatcher.py
+
+import asyncio
+import time
+import logging
+from collections import OrderedDict, deque
+from config.settings import MAX_CONCURRENT_REQUESTS, PRIORITY_WEIGHTS, USER_QUEUE_LIMIT
+
+logger = logging.getLogger('discord')
+
+class QueueFullError(Exception):
+    """Raised when a user already has ``user_queue_limit`` requests pending"""
+
+class RequestDispatcher:
+    """Runs generations one at a time per user, with a global cap on upstream requests.
+
+    Each user has a FIFO lock so at most one generation touches their conversation
+    at a time, and a user with ``user_queue_limit`` requests pending is turned away.
+    Requests counted with ``admit`` stay pending until ``settle``, even if the
+    caller cancels them in favour of newer ones.
+    When every upstream slot is taken, waiting requests are served by a weighted
+    deficit round robin over priority classes (DM, channel, admin, re-roll,
+    background), and round robin across users within a class, so a busy user or
+    channel can't starve everyone else.
+    """
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, weights=PRIORITY_WEIGHTS,
+                 user_queue_limit=USER_QUEUE_LIMIT):
+        self.max_concurrent = max_concurrent
+        self.weights = {priority: max(0.1, float(weight)) for priority, weight in weights.items()}
+        self.weights.setdefault("channel", 1.0)  # Used for unknown classes
+        self.user_queue_limit = user_queue_limit
+        self.user_locks = {}
+        self.queue_depths = {}
+        self.admitted = {}  # user id -> requests admitted since the user's latest one finished
+
+        # Scheduler state: per class, the users waiting for a slot in round robin order
+        self.classes = sorted(self.weights, key=self.weights.get, reverse=True)
+        self.queues = {priority: OrderedDict() for priority in self.classes}
+        self.deficits = {priority: 0.0 for priority in self.classes}
+        self.current_class = 0
+        self.quantum_granted = False  # whether the current class got its quantum this round
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.served = {priority: 0 for priority in self.classes}
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def run(self, user_id, coro_factory, priority="channel"):
+        """Await ``coro_factory()`` once the user's earlier requests and a global slot are free.
+
+        Raises QueueFullError if the user already has too many requests pending.
+        """
+        return await self._run_for_user(user_id, lambda: self._run_limited(coro_factory, user_id, priority))
+
+    async def run_local(self, user_id, coro_factory):
+        """Await ``coro_factory()`` after the user's earlier requests, without taking an upstream slot.
+
+        For quick work on the user's state that doesn't call the API.
+        """
+        return await self._run_for_user(user_id, coro_factory)
+
+    def admit(self, user_id):
+        """Count a new request from the user until ``settle`` is called.
+
+        Raises QueueFullError if the user already has ``user_queue_limit`` requests
+        pending, so a burst of messages is turned away before it can cancel the
+        request in flight.
+        """
+        admitted = self.admitted.get(user_id, 0)
+        if self.user_queue_limit and admitted >= self.user_queue_limit:
+            self._reject(user_id)
+        self.admitted[user_id] = admitted + 1
+
+    def settle(self, user_id):
+        """The user's latest request finished; the ones it superseded no longer count"""
+        self.admitted.pop(user_id, None)
+
+    def _reject(self, user_id):
+        self.rejected += 1
+        logger.warning("Request rejected, user queue is full", extra={'user_id': user_id, 'command': 'dispatch'})
+        raise QueueFullError("You already have a few requests waiting. Please wait for a reply before sending more.")
+
+    async def _run_for_user(self, user_id, coro_factory):
+        if self.user_queue_limit and self.queue_depths.get(user_id, 0) >= self.user_queue_limit:
+            self._reject(user_id)
+
+        lock = self.user_locks.setdefault(user_id, asyncio.Lock())
+        self.queue_depths[user_id] = self.queue_depths.get(user_id, 0) + 1
+        try:
+            async with lock:
+                return await coro_factory()
+        finally:
+            self.queue_depths[user_id] -= 1
+            if not self.queue_depths[user_id]:
+                # Nobody holds or waits on the lock anymore
+                del self.queue_depths[user_id]
+                del self.user_locks[user_id]
+
+    async def run_background(self, coro_factory):
+        """Await ``coro_factory()`` under the global limit only, for work that doesn't touch history"""
+        return await self._run_limited(coro_factory, priority="background")
+
+    async def _run_limited(self, coro_factory, user_id='N/A', priority="channel"):
+        if priority not in self.weights:
+            priority = "channel"
+
+        enqueued = time.monotonic()
+        await self._acquire_slot(user_id, priority)
+
+        wait_time = time.monotonic() - enqueued
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.served[priority] += 1
+        if wait_time > 5:
+            logger.warning(f"Request waited {wait_time:.1f}s for an upstream slot",
+                          extra={'user_id': user_id, 'command': 'dispatch'})
+
+        try:
+            return await coro_factory()
+        finally:
+            self.completed += 1
+            self._release_slot()
+
+    async def _acquire_slot(self, user_id, priority):
+        if self.in_flight < self.max_concurrent:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        users = self.queues[priority]
+        users.setdefault(user_id, deque()).append(future)
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self._release_slot()
+            else:
+                self._remove_waiter(users, user_id, future)
+            raise
+
+    def _remove_waiter(self, users, user_id, future):
+        waiters = users.get(user_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.waiting -= 1
+            if not waiters:
+                del users[user_id]
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        while self.waiting and self.in_flight < self.max_concurrent:
+            future = self._next_waiter()
+            if future.done():
+                # Cancelled before its task got to run; the slot goes to the next waiter
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _next_waiter(self):
+        """Pick the next waiting request by deficit round robin over the priority classes"""
+        while True:
+            priority = self.classes[self.current_class]
+            users = self.queues[priority]
+            if users:
+                if not self.quantum_granted:
+                    self.deficits[priority] += self.weights[priority]
+                    self.quantum_granted = True
+                if self.deficits[priority] >= 1:
+                    self.deficits[priority] -= 1
+                    user_id, waiters = next(iter(users.items()))
+                    future = waiters.popleft()
+                    if waiters:
+                        users.move_to_end(user_id)
+                    else:
+                        del users[user_id]
+                    self.waiting -= 1
+                    return future
+            else:
+                # Idle classes don't build up credit
+                self.deficits[priority] = 0.0
+            self.current_class = (self.current_class + 1) % len(self.classes)
+            self.quantum_granted = False
+
+    def get_metrics(self):
+        queued_users = len(self.queue_depths)
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "waiting_for_slot": self.waiting,
+            "peak_waiting_for_slot": self.peak_waiting,
+            "waiting_by_priority": {
+                priority: sum(len(waiters) for waiters in users.values()) for priority, users in self.queues.items()
+            },
+            "served_by_priority": dict(self.served),
+            "queued_users": queued_users,
+            "max_user_queue_depth": max(self.queue_depths.values(), default=0),
+            "max_user_pending": max(self.admitted.values(), default=0),
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_wait_time": round(self.total_wait_time / self.completed, 3) if self.completed else 0.0,
+            "max_wait_time": round(self.max_wait_time, 3),
+        }
@@ -0,0 +1,158 @@
+# services/response_processor.py
+
+import os
+import re
+
+# Common abbreviations that don't end sentences
+ABBREVIATIONS = frozenset({
+    'mr.', 'mrs.', 'ms.', 'dr.', 'prof.', 'sr.', 'jr.',
+    'vs.', 'etc.', 'e.g.', 'i.e.',
+    'inc.', 'ltd.', 'corp.', 'llc.', 'co.'
+})
+MAX_ABBREVIATION_LENGTH = max(len(abbreviation) for abbreviation in ABBREVIATIONS)
+
+# Words (and punctuation) that indicate a sentence was cut off
+INCOMPLETE_ENDINGS = (
+    'and', 'but', 'or', 'nor', 'for', 'yet', 'so',
+    'with', 'to', 'in', 'at', 'by',
+    ',', ', and', ', or'
+)
+INCOMPLETE_WORDS = frozenset(INCOMPLETE_ENDINGS)
+
+SENTENCE_PUNCTUATION = re.compile(r'[.!?]')
+NEXT_WORD = re.compile(r'\s*(\S*)')
+
+def sentence_boundaries(text):
+    """Yield the index just past each sentence-ending punctuation mark in ``text``.
+
+    Abbreviations and decimal numbers are not treated as sentence ends, and a
+    mark at the very start only counts when followed by whitespace.
+    """
+    length = len(text)
+    word_start = 0
+    searched = 0
+
+    for match in SENTENCE_PUNCTUATION.finditer(text):
+        i = match.start()
+
+        # Only search for a space since the previous mark, keeping the scan linear
+        space = text.rfind(' ', searched, i)
+        if space != -1:
+            word_start = space + 1
+        searched = i
+
+        if i + 1 - word_start <= MAX_ABBREVIATION_LENGTH and text[word_start:i + 1].lower() in ABBREVIATIONS:
+            continue
+
+        if 0 < i < length - 1:
+            # Skip numbers (e.g. "3.14")
+            if text[i - 1].isdigit() and text[i + 1].isdigit():
+                continue
+        elif i < length - 1 and not text[i + 1].isspace():
+            continue
+
+        yield i + 1
+
+def split_sentences(text):
+    """Split ``text`` into stripped sentences, keeping any unterminated tail as the last one"""
+    sentences = []
+    last_end = 0
+    for end in sentence_boundaries(text):
+        sentences.append(text[last_end:end].strip())
+        last_end = end
+
+    remaining = text[last_end:].strip()
+    if remaining:
+        sentences.append(remaining)
+    return sentences
+
+def paginate(text, max_length=1900):
+    """Split ``text`` into chunks of at most ``max_length`` characters for separate messages.
+
+    Chunks break at the last paragraph break or sentence end followed by
+    whitespace that keeps them at least half full, falling back to a line break or space, and only cut inside a
+    word when there is no whitespace at all.
+    """
+    chunks = []
+    text = text.strip()
+    while len(text) > max_length:
+        window = text[:max_length + 1]
+        split = window.rfind('\n\n', 0, max_length)
+        if split < max_length // 2:
+            # Only marks followed by whitespace, so URLs and file names stay whole
+            split = max(
+                (end for end in sentence_boundaries(window) if end <= max_length and window[end].isspace()),
+                default=-1
+            )
+        if split < max_length // 2:
+            split = max(window.rfind('\n', 0, max_length), window.rfind(' ', 0, max_length))
+        if split <= 0:
+            split = max_length
+
+        chunks.append(text[:split].rstrip())
+        text = text[split:].lstrip()
+
+    if text:
+        chunks.append(text)
+    return chunks
+
+def join_continuation(previous, continuation):
+    """Append ``continuation`` to ``previous``, adding a space after a finished sentence.
+
+    A continuation may start mid-word, so it is otherwise joined as is.
+    """
+    if (previous and continuation and not previous[-1].isspace() and not continuation[0].isspace()
+            and previous.rstrip('"\'*)_').endswith(('.', '!', '?'))):
+        return previous + ' ' + continuation
+    return previous + continuation
+
+def restarts_reply(previous, continuation, prefix_length=40):
+    """Whether ``continuation`` starts the previous reply over instead of extending it.
+
+    That is, it opens with the first ``prefix_length`` characters of the previous
+    reply, or with at least half of a shorter one.
+    """
+    previous = previous.strip()
+    head = previous[:prefix_length]
+    common = len(os.path.commonprefix([head, continuation.strip()[:len(head)]]))
+    return common >= 10 and common >= min(len(head), len(previous) // 2)
+
+def _last_complete_sentence_end(text):
+    """Index of the last sentence mark not followed by a word that continues the sentence, or -1"""
+    for match in reversed(list(SENTENCE_PUNCTUATION.finditer(text))):
+        i = match.start()
+        next_word = NEXT_WORD.match(text, i + 1).group(1).lower()
+        if not next_word or next_word not in INCOMPLETE_WORDS:
+            return i
+    return -1
+
+def trim_incomplete_response(text, finish_reason):
+    """Trim a trailing incomplete sentence from a reply that didn't finish naturally"""
+    if finish_reason == "stop":
+        return text
+
+    sentences = split_sentences(text)
+    if not sentences:
+        return text
+
+    text = ' '.join(sentences)
+    stripped = text.rstrip()
+    last_words = stripped.lower().rsplit(None, 1)
+
+    ends_with_incomplete = (
+        not stripped.endswith(('.', '!', '?')) or
+        (last_words and last_words[-1].endswith(INCOMPLETE_ENDINGS))
+    )
+
+    # Handle malformed punctuation
+    if '.' in text and not text.endswith('.'):
+        last_period = text.rindex('.')
+        if last_period > len(text) * 0.75:
+            text = text[:last_period + 1]
+
+    if ends_with_incomplete:
+        last_complete = _last_complete_sentence_end(text)
+        if last_complete != -1:
+            text = text[:last_complete + 1].strip()
+
+    return text
@@ -0,0 +1,55 @@
+# services/tokenizer.py
+
+import os
+import logging
+from config.settings import TOKENIZER_PATH
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+logger = logging.getLogger('discord')
+
+class HeuristicTokenEstimator:
+    """Rough estimate of roughly four characters per token"""
+    name = "heuristic"
+
+    def count(self, text):
+        return len(text) // 4
+
+    def count_message(self, message):
+        return self.count(message.get("content") or "")
+
+class BPETokenEstimator:
+    """Exact token counts from a local BPE vocabulary (a Hugging Face ``tokenizer.json``)"""
+    name = "bpe"
+
+    # Role markers and separators added by the chat template around each message
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, path):
+        self.tokenizer = Tokenizer.from_file(path)
+
+    def count(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count_message(self, message):
+        return self.count(message.get("content") or "") + self.MESSAGE_OVERHEAD
+
+def load_token_estimator(path=TOKENIZER_PATH):
+    """Use the BPE vocabulary at ``path`` when available, otherwise fall back to the heuristic"""
+    if path and os.path.exists(path):
+        if Tokenizer is None:
+            logger.warning(f"Found {path} but the 'tokenizers' package is not installed; using heuristic token counts", 
+                          extra={'user_id': 'N/A', 'command': 'load_token_estimator'})
+        else:
+            try:
+                estimator = BPETokenEstimator(path)
+                logger.info(f"Loaded tokenizer from {path}", 
+                           extra={'user_id': 'N/A', 'command': 'load_token_estimator'})
+                return estimator
+            except Exception as e:
+                logger.error(f"Error loading tokenizer from {path}: {str(e)}", 
+                            extra={'user_id': 'N/A', 'command': 'load_token_estimator'})
+    return HeuristicTokenEstimator()
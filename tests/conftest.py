@@ -0,0 +1,11 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# config.settings parses these at import time
+os.environ.setdefault("ALLOWED_CHANNEL_IDS", "1")
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("DISCORD_TOKEN", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
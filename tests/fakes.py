@@ -0,0 +1,42 @@
+# tests/fakes.py
+
+import asyncio
+import json
+
+class FakeResponse:
+    """Stands in for an aiohttp response to a completion request"""
+    def __init__(self, status=200, body=b"{}", delay=0.0):
+        self.status = status
+        self.headers = {}
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return self.body
+
+def completion(content, finish_reason="stop"):
+    return FakeResponse(body={"choices": [{"message": {"content": content}, "finish_reason": finish_reason}]})
+
+def choices(*contents):
+    return FakeResponse(body={"choices": [
+        {"message": {"content": content}, "finish_reason": "stop"} for content in contents
+    ]})
+
+class FakeSession:
+    """Returns the queued responses in order, repeating the last one"""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, data=None, **kwargs):
+        self.requests.append(json.loads(data))
+        if len(self.responses) > 1:
+            return self.responses.pop(0)
+        return self.responses[0]
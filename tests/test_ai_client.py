@@ -0,0 +1,139 @@
+# tests/test_ai_client.py
+
+import asyncio
+import pytest
+import services.ai_client as ai_client_module
+import services.conversation_manager as conversation_manager_module
+from services.ai_client import AIClient, ErrorReply, choices_prefetch_temperature
+from services.conversation_log import ConversationLog
+from services.conversation_manager import ConversationManager
+from services.prompt_prefix import PromptPrefix
+from fakes import FakeResponse, FakeSession, completion, choices
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_manager_module, "CONVERSATION_DB_PATH", "")
+    manager = ConversationManager()
+    manager.conversation_log = ConversationLog(str(tmp_path))
+    return manager
+
+def contents(manager, user_id):
+    return [message["content"] for message in manager.get_conversation(user_id)]
+
+def test_failed_reroll_keeps_the_previous_reply(manager):
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(
+            completion("First reply."),
+            FakeResponse(status=400, body={"error": {"type": "INVALID_REQUEST", "message": "bad"}}),
+        )
+        assert await client.chat_with_model(1, "hello", manager, username="bob") == "First reply."
+        return await client.chat_with_model(1, "hello", manager, username="bob", reroll=True)
+
+    result = asyncio.run(run())
+    assert isinstance(result, ErrorReply)
+    assert contents(manager, 1) == ["bob: hello", "First reply."]
+
+def test_cancelled_reroll_keeps_the_previous_reply(manager):
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(completion("First reply."), FakeResponse(delay=10))
+        await client.chat_with_model(1, "hello", manager, username="bob")
+        reroll = asyncio.create_task(client.chat_with_model(1, "hello", manager, username="bob", reroll=True))
+        await asyncio.sleep(0.01)
+        client.cancel_generation(1)
+        return await reroll
+
+    assert asyncio.run(run()) is None
+    assert contents(manager, 1) == ["bob: hello", "First reply."]
+
+def test_burst_is_capped_without_cancelling_the_request_in_flight(manager):
+    async def run():
+        client = AIClient()
+        client.dispatcher.user_queue_limit = 3
+        client.session = FakeSession(completion("Reply."))
+        burst = await asyncio.gather(*(
+            client.chat_with_model(1, f"message {n}", manager, username="bob") for n in range(6)
+        ))
+        after = await client.chat_with_model(1, "later", manager, username="bob")
+        return client, burst, after
+
+    client, burst, after = asyncio.run(run())
+    assert burst[:3] == [None, None, "Reply."]
+    assert all(isinstance(result, ErrorReply) for result in burst[3:])
+    assert client.dispatcher.rejected == 3
+    assert client.cancelled_generations == 2
+    assert after == "Reply."
+    assert contents(manager, 1) == ["bob: message 2", "Reply.", "bob: later", "Reply."]
+
+def test_background_prefetch_samples_like_the_reroll_it_serves(manager, monkeypatch):
+    monkeypatch.setattr(ai_client_module, "REROLL_PREFETCH_MODE", "background")
+    monkeypatch.setattr(ai_client_module, "REROLL_PREFETCH_COUNT", 2)
+
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(completion("First reply."), choices("Spare one.", "Spare two."))
+        await client.chat_with_model(1, "hello", manager, username="bob")
+        manager.save_response_message_id(1, 100)
+        client.prefetch_rerolls(1, manager)
+        await client.prefetch_tasks[1]
+
+        prefetch_request = client.session.requests[-1]
+        low = await client.serve_prefetched_reroll(1, manager, 0.7)
+        same = await client.serve_prefetched_reroll(1, manager, 1.0)
+        return prefetch_request, low, same
+
+    prefetch_request, low, same = asyncio.run(run())
+    assert prefetch_request["temperature"] == pytest.approx(1.1)
+    assert prefetch_request.get("top_p", 1.0) == 1.0
+    assert prefetch_request["n"] == 2
+    assert low is None
+    assert same == "Spare one."
+    assert contents(manager, 1) == ["bob: hello", "Spare one."]
+
+def test_spare_choices_only_requested_for_a_menu_option_that_can_use_them():
+    # A re-roll at 1.0 samples at 1.1, so a reply at 1.0 can't serve any option
+    assert choices_prefetch_temperature({"temperature": 1.0, "top_p": 1.0}) is None
+    assert choices_prefetch_temperature({"temperature": 1.1, "top_p": 1.0}) == 1.0
+    assert choices_prefetch_temperature({"temperature": 0.8, "top_p": 0.9}) is None
+
+def test_continue_extends_the_last_reply(manager):
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(completion("It was late."), completion("Then it rained."))
+        await client.chat_with_model(1, "hello", manager, username="bob")
+        return client, await client.chat_with_model(1, None, manager, username="bob", continue_last=True)
+
+    client, result = asyncio.run(run())
+    assert result == "Then it rained."
+    assert client.session.requests[-1]["continue_final_message"] is True
+    assert contents(manager, 1) == ["bob: hello", "It was late. Then it rained."]
+
+def test_continue_refuses_a_restarted_reply(manager):
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(
+            completion("Once upon a time there was a dragon."),
+            completion("Once upon a time there was a dragon who slept."),
+        )
+        await client.chat_with_model(1, "hello", manager, username="bob")
+        return await client.chat_with_model(1, None, manager, username="bob", continue_last=True)
+
+    assert isinstance(asyncio.run(run()), ErrorReply)
+    assert contents(manager, 1) == ["bob: hello", "Once upon a time there was a dragon."]
+
+def test_persona_swaps_count_as_prefix_changes(manager):
+    other = PromptPrefix("other", "You are someone else.")
+
+    async def run():
+        client = AIClient()
+        client.session = FakeSession(completion("Reply."))
+        await client.chat_with_model(1, "hello", manager, username="bob")
+        await client.chat_with_model(1, "again", manager, username="bob")
+        await client.chat_with_model(1, "switch", manager, username="bob", persona=other)
+
+    asyncio.run(run())
+    assert manager.get_metrics()["context_trimming"]["prefix_changes"] == 1
+
+    manager.clear_history(1)
+    assert manager.get_metrics()["context_trimming"]["prefix_changes"] == 2
@@ -0,0 +1,62 @@
+# tests/test_background_writer.py
+
+import threading
+import time
+from utils.background_writer import BackgroundWriter
+
+class StalledWriter(BackgroundWriter):
+    """A writer whose first batch waits until ``release`` is set, like a slow disk"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def _write_batch(self, batch):
+        self.release.wait(5)
+        super()._write_batch(batch)
+
+def test_full_queue_never_blocks_and_keeps_order(tmp_path):
+    writer = StalledWriter(max_queue_size=4, batch_size=1, flush_interval=0)
+    path = str(tmp_path / "log.jsonl")
+    other = str(tmp_path / "export.json")
+
+    started = time.monotonic()
+    futures = [writer.write(path, f"{i}\n") for i in range(6)]
+    futures.append(writer.write(other, "old", mode='w'))
+    futures.append(writer.write(other, "new", mode='w'))
+    assert time.monotonic() - started < 1
+
+    writer.release.set()
+    writer.flush()
+    for future in futures:
+        future.result(timeout=5)
+    writer.close()
+
+    with open(path, encoding='utf-8') as file:
+        assert file.read() == "".join(f"{i}\n" for i in range(6))
+    with open(other, encoding='utf-8') as file:
+        assert file.read() == "new"
+    assert writer.get_metrics()["coalesced_writes"] > 0
+    assert writer.get_metrics()["dropped_writes"] == 0
+
+def test_only_droppable_writes_are_dropped_beyond_the_overflow_limit(tmp_path):
+    writer = StalledWriter(max_queue_size=2, batch_size=1, flush_interval=0)
+    log_path = str(tmp_path / "log.jsonl")
+    bot_log = str(tmp_path / "bot.log")
+
+    chat_futures, log_futures = [], []
+    for i in range(10):
+        chat_futures.append(writer.write(log_path, f"{i}\n"))
+        log_futures.append(writer.write(bot_log, f"{i}\n", droppable=True))
+    writer.release.set()
+    writer.close()
+
+    assert all(future.exception(timeout=5) is None for future in chat_futures)
+    with open(log_path, encoding='utf-8') as file:
+        assert file.read() == "".join(f"{i}\n" for i in range(10))
+
+    failed = [future for future in log_futures if future.exception(timeout=5) is not None]
+    assert writer.get_metrics()["dropped_writes"] == len(failed) > 0
+    with open(bot_log, encoding='utf-8') as file:
+        lines = file.read().split()
+    assert lines == sorted(lines, key=int)
+    assert len(lines) == 10 - len(failed)
@@ -0,0 +1,73 @@
+# tests/test_circuit_breaker.py
+
+import asyncio
+import time
+import pytest
+from services.ai_client import AIClient, CompletionError
+from services.rate_limiter import CircuitBreaker
+from fakes import FakeResponse, FakeSession
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    # Let the cooldown pass
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30)
+    open_breaker(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+
+def make_client(response):
+    client = AIClient()
+    client.session = FakeSession(response)
+    client.circuit_breaker = CircuitBreaker(failure_threshold=1, cooldown=30)
+    open_breaker(client.circuit_breaker)
+    return client
+
+def test_cancelled_probe_releases_the_breaker():
+    async def run():
+        client = make_client(FakeResponse(delay=10))
+        probe = asyncio.create_task(client._request_completion(1, b"{}", max_retries=0))
+        await asyncio.sleep(0.01)
+        assert client.circuit_breaker.probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return client.circuit_breaker
+
+    breaker = asyncio.run(run())
+    assert not breaker.probe_in_flight
+    assert breaker.allow_request()
+
+def test_probe_with_invalid_response_releases_the_breaker():
+    async def run():
+        client = make_client(FakeResponse(body=b"not json"))
+        with pytest.raises(CompletionError):
+            await client._request_completion(1, b"{}", max_retries=0)
+        return client.circuit_breaker
+
+    breaker = asyncio.run(run())
+    assert not breaker.probe_in_flight
+    assert breaker.allow_request()
+
+def test_successful_probe_closes_the_breaker():
+    async def run():
+        client = make_client(FakeResponse(body=b'{"choices": []}'))
+        result = await client._request_completion(1, b"{}", max_retries=0)
+        return result, client.circuit_breaker
+
+    result, breaker = asyncio.run(run())
+    assert result == {"choices": []}
+    assert breaker.state == "closed"
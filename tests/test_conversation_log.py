@@ -0,0 +1,51 @@
+# tests/test_conversation_log.py
+
+import asyncio
+from services.conversation import Conversation
+from services.conversation_log import ConversationLog, apply_change
+from services.prompt_prefix import PromptPrefix
+from services.tokenizer import HeuristicTokenEstimator
+
+def replay(changes):
+    messages = []
+    for change in changes:
+        apply_change(messages, change)
+    return messages
+
+def test_replay_rebuilds_the_conversation():
+    conversation = Conversation(HeuristicTokenEstimator())
+    conversation.set_prefix(PromptPrefix("a", "First persona", [{"role": "user", "content": "hi"}]))
+    conversation.append({"role": "user", "content": "one"})
+    conversation.append({"role": "assistant", "content": "reply one"})
+    conversation.append({"role": "user", "content": "two"})
+    conversation.append({"role": "assistant", "content": "reply two"})
+    conversation.pop()
+    conversation.append({"role": "assistant", "content": "re-rolled"})
+    conversation.set_content(-1, "re-rolled, continued")
+    conversation.set_prefix(PromptPrefix("b", "Second persona"), "\nsuffix")
+
+    changes = conversation.take_unlogged_changes()
+    assert replay(changes) == conversation.full_messages()
+
+def test_trimming_does_not_affect_replay():
+    conversation = Conversation(HeuristicTokenEstimator(), prefix=PromptPrefix("a", "Persona"))
+    for i in range(10):
+        conversation.append({"role": "user", "content": f"message {i}"})
+    full_before_trim = conversation.full_messages()
+    conversation.trim(conversation.total_tokens // 2)
+    conversation.set_content(-1, "edited")
+
+    expected = full_before_trim[:-1] + [{"role": "user", "content": "edited"}]
+    assert replay(conversation.take_unlogged_changes()) == expected
+
+def test_read_session_from_disk(tmp_path):
+    log = ConversationLog(str(tmp_path))
+    session = log.start_session(7)
+    conversation = Conversation(HeuristicTokenEstimator(), prefix=PromptPrefix("a", "Persona"))
+    conversation.append({"role": "user", "content": "hello"})
+    log.append(7, session, conversation.take_unlogged_changes())
+    conversation.append({"role": "assistant", "content": "hi"})
+    log.append(7, session, conversation.take_unlogged_changes())
+
+    assert asyncio.run(log.read_session(7, session)) == conversation.full_messages()
+    assert ConversationLog(str(tmp_path)).start_session(7) == session + 1
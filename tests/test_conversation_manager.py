@@ -0,0 +1,87 @@
+# tests/test_conversation_manager.py
+
+import asyncio
+import threading
+import time
+import pytest
+import services.conversation_manager as conversation_manager_module
+from services.conversation_manager import ConversationManager
+from services.conversation_store import ConversationStore
+from services.prompt_prefix import PromptPrefix
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_manager_module, "ConversationStore",
+                        lambda: ConversationStore(str(tmp_path / "conversations.db")))
+    manager = ConversationManager()
+    yield manager
+    manager.store.close()
+
+def test_cache_counts_one_lookup_per_generation(manager):
+    for _ in range(3):
+        with manager.pinned(1):
+            manager.get_conversation(1)
+            manager.get_user_params(1)
+            manager.get_last_response(1)
+            manager.get_response_message_id(1)
+
+    cache = manager.get_metrics()["cache"]
+    assert cache["misses"] == 1
+    assert cache["hits"] == 2
+    assert cache["hit_rate"] == round(2 / 3, 4)
+
+def test_reply_message_ids_survive_a_reload(manager):
+    manager.save_response_messages(1, [10, 11, 12])
+    manager._import_user(2, manager._export_user(1))
+    assert manager.get_response_messages(2) == [10, 11, 12]
+    assert manager.get_response_message_id(2) == 12
+
+    manager.save_response_message_id(1, 20)
+    assert manager.get_response_messages(1) == [20]
+
+def test_shared_persona_is_not_counted_per_user(manager):
+    persona = manager.personas.personas["long"] = PromptPrefix("long", "A very long persona. " * 500)
+    for user_id in (1, 2):
+        manager.set_prefix(user_id, persona, f"\nYou are talking to Discord user 'user{user_id}'.")
+        manager.get_conversation(user_id).append({"role": "user", "content": "hi"})
+
+    assert manager._estimate_user_size(1) < 1000
+    assert manager._estimate_shared_size() > len(persona.personality)
+
+def test_eviction_waits_for_a_running_flush(manager, monkeypatch):
+    monkeypatch.setattr(conversation_manager_module, "CACHE_IDLE_TIMEOUT", 1e-9)
+    writes = []
+    save_users = manager.store.save_users
+
+    def slow_save_users(states):
+        start = time.monotonic()
+        time.sleep(0.05)
+        save_users(states)
+        writes.append((start, time.monotonic()))
+
+    monkeypatch.setattr(manager.store, "save_users", slow_save_users)
+
+    async def run():
+        manager.save_original_message(1, "hello")
+        await asyncio.gather(manager.flush(), manager.evict())
+
+    asyncio.run(run())
+    assert len(writes) == 2
+    (first_start, first_end), (second_start, _) = sorted(writes)
+    assert second_start >= first_end
+    assert manager.store.load_user(1)["original_message"] == "hello"
+
+def test_persona_assignments_are_saved_off_the_event_loop(manager, monkeypatch):
+    manager.personas.personas["other"] = PromptPrefix("other", "Someone else.")
+    threads = []
+    save_persona_assignment = manager.store.save_persona_assignment
+
+    def recording_save(*args):
+        threads.append(threading.current_thread())
+        save_persona_assignment(*args)
+
+    monkeypatch.setattr(manager.store, "save_persona_assignment", recording_save)
+    asyncio.run(manager.assign_persona("channel", 5, "other"))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert manager.store.load_persona_assignments() == {("channel", 5): "other"}
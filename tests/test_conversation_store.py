@@ -0,0 +1,25 @@
+# tests/test_conversation_store.py
+
+import threading
+from services.conversation_store import ConversationStore
+
+def test_loads_do_not_wait_on_a_flush_in_progress(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    store.save_users({1: {
+        "messages": "[]", "log_session": None, "params": None, "last_response": "Hi.",
+        "original_message": None, "response_message_id": None, "response_chunk_ids": None,
+        "reroll_parameters": None, "reroll_count": 0,
+    }})
+
+    loaded = []
+    with store.lock, store.connection:
+        # A write-behind transaction is open while the user is loaded
+        store.connection.execute("UPDATE user_state SET last_response = 'Changed.'")
+        reader = threading.Thread(target=lambda: loaded.append(store.load_user(1)), daemon=True)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+
+    assert loaded[0]["last_response"] == "Hi."
+    assert store.load_user(1)["last_response"] == "Changed."
+    store.close()
@@ -0,0 +1,57 @@
+# tests/test_debouncer.py
+
+import asyncio
+from utils.debouncer import Debouncer
+
+def test_burst_is_delivered_once():
+    async def run():
+        bursts = []
+
+        async def callback(key, items):
+            bursts.append((key, items))
+
+        debouncer = Debouncer(0.05, callback)
+        for item in ("a", "b", "c"):
+            debouncer.submit("user", item)
+            await asyncio.sleep(0.01)
+        debouncer.submit("other", "x")
+        await asyncio.sleep(0.15)
+        return bursts, debouncer.get_metrics()
+
+    bursts, metrics = asyncio.run(run())
+    assert sorted(bursts) == [("other", ["x"]), ("user", ["a", "b", "c"])]
+    assert metrics["bursts"] == 2
+    assert metrics["coalesced"] == 2
+
+def test_max_wait_limits_a_steady_trickle():
+    async def run():
+        bursts = []
+
+        async def callback(key, items):
+            bursts.append(list(items))
+
+        debouncer = Debouncer(0.05, callback, max_wait=0.1)
+        for i in range(8):
+            debouncer.submit("user", i)
+            await asyncio.sleep(0.03)
+        await asyncio.sleep(0.1)
+        return bursts
+
+    bursts = asyncio.run(run())
+    assert len(bursts) >= 2
+    assert [item for burst in bursts for item in burst] == list(range(8))
+
+def test_close_cancels_pending_bursts():
+    async def run():
+        bursts = []
+
+        async def callback(key, items):
+            bursts.append(items)
+
+        debouncer = Debouncer(0.05, callback)
+        debouncer.submit("user", "a")
+        debouncer.close()
+        await asyncio.sleep(0.1)
+        return bursts
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,141 @@
+# tests/test_events.py
+
+import asyncio
+import types
+import discord
+import pytest
+import services.conversation_manager as conversation_manager_module
+from cogs.events import BotEvents, replace_reply
+from services.ai_client import AIClient
+from services.conversation_log import ConversationLog
+from services.conversation_manager import ConversationManager
+from fakes import FakeSession, completion
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        if self.id in self.channel.missing:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        self.channel.edited.append((self.id, kwargs["content"], kwargs["view"]))
+
+    async def delete(self):
+        self.channel.deleted.append(self.id)
+
+class FakeChannel:
+    id = 10
+
+    def __init__(self, missing=()):
+        self.sent = []
+        self.edited = []
+        self.deleted = []
+        self.missing = set(missing)
+
+    def typing(self):
+        return FakeTyping()
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def send(self, content, **kwargs):
+        self.sent.append((content, kwargs))
+        return types.SimpleNamespace(id=1000 + len(self.sent))
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = None
+        self.author = types.SimpleNamespace(id=1, name="bob")
+        self.replies = []
+
+    async def reply(self, content, **kwargs):
+        self.replies.append((content, kwargs))
+        return types.SimpleNamespace(id=100 + len(self.replies))
+
+@pytest.fixture
+def events(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_manager_module, "CONVERSATION_DB_PATH", "")
+    manager = ConversationManager()
+    manager.conversation_log = ConversationLog(str(tmp_path))
+    client = AIClient()
+    client.session = FakeSession(completion("A reply."))
+    bot = types.SimpleNamespace(ai_client=client, conversation_manager=manager)
+    return BotEvents(bot)
+
+def test_reply_gets_buttons_and_is_saved(events):
+    message = FakeMessage(FakeChannel())
+    asyncio.run(events.respond(message, "hello"))
+
+    manager = events.bot.conversation_manager
+    [(content, kwargs)] = message.replies
+    assert content == "A reply."
+    assert "view" in kwargs and kwargs["view"] is not None
+    assert manager.get_response_message_id(1) == 101
+    assert manager.get_original_message(1) == "hello"
+
+def test_full_queue_gets_a_plain_notice(events):
+    manager = events.bot.conversation_manager
+    client = events.bot.ai_client
+    manager.save_original_message(1, "earlier")
+    manager.save_response_message_id(1, 42)
+    for _ in range(client.dispatcher.user_queue_limit):
+        client.dispatcher.admit(1)
+
+    message = FakeMessage(FakeChannel())
+    asyncio.run(events.respond(message, "hello"))
+
+    [(content, kwargs)] = message.replies
+    assert "requests waiting" in content
+    assert kwargs.get("view") is None
+    assert manager.get_original_message(1) == "earlier"
+    assert manager.get_response_message_id(1) == 42
+    assert len(manager.get_conversation(1)) == 0
+    assert not client.prefetch_tasks
+
+def test_reply_split_across_messages_is_saved_whole(events):
+    events.bot.ai_client.session = FakeSession(completion("A long sentence. " * 200))
+    channel = FakeChannel()
+    message = FakeMessage(channel)
+    asyncio.run(events.respond(message, "hello"))
+
+    manager = events.bot.conversation_manager
+    assert len(channel.sent) >= 1
+    assert manager.get_response_messages(1) == [101] + [1000 + n for n in range(1, len(channel.sent) + 1)]
+    assert manager.get_response_message_id(1) == 1000 + len(channel.sent)
+
+def test_shorter_reroll_edits_from_the_first_chunk_and_deletes_the_rest():
+    channel = FakeChannel()
+    view = object()
+    message_ids = asyncio.run(replace_reply(channel, [1, 2, 3], ["one", "two"], view=view))
+
+    assert message_ids == [1, 2]
+    assert channel.edited == [(1, "one", None), (2, "two", view)]
+    assert channel.deleted == [3]
+    assert channel.sent == []
+
+def test_longer_reroll_sends_the_extra_chunks():
+    channel = FakeChannel()
+    view = object()
+    message_ids = asyncio.run(replace_reply(channel, [1], ["one", "two", "three"], view=view))
+
+    assert message_ids == [1, 1001, 1002]
+    assert channel.edited == [(1, "one", None)]
+    assert channel.sent == [("two", {}), ("three", {"view": view})]
+    assert channel.deleted == []
+
+def test_failed_edit_resends_the_rest_and_removes_old_chunks():
+    channel = FakeChannel(missing={2})
+    message_ids = asyncio.run(replace_reply(channel, [1, 2, 3], ["one", "two", "three"]))
+
+    assert message_ids == [1, 1001, 1002]
+    assert channel.edited == [(1, "one", None)]
+    assert channel.deleted == [2, 3]
@@ -0,0 +1,62 @@
+# tests/test_preset_registry.py
+
+import asyncio
+import json
+import os
+from services.parameters import ParameterLayers
+from services.preset_registry import PresetError, PresetRegistry, validate_params
+
+def test_validate_params_accepts_the_shipped_presets():
+    textgen = os.path.join(os.path.dirname(os.path.dirname(__file__)), "textgen")
+    for file_name in os.listdir(textgen):
+        with open(os.path.join(textgen, file_name), encoding="utf-8") as file:
+            assert validate_params(json.load(file)) == [], file_name
+
+def test_validate_params_reports_problems():
+    problems = validate_params({"temperature": True, "top_k": "5", "bogus": 1, "model": "nope", "logit_bias": {"1": 2}})
+    assert "unknown parameter 'bogus'" in problems
+    assert "unknown model 'nope'" in problems
+    assert any(problem.startswith("'temperature'") for problem in problems)
+    assert any(problem.startswith("'top_k'") for problem in problems)
+    assert len(problems) == 4
+    assert validate_params([1, 2]) == ["expected a JSON object of parameters"]
+
+def write(path, params):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(params, file)
+    # Make sure the change is visible even on file systems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_registry_loads_and_hot_reloads_the_active_preset(tmp_path):
+    write(tmp_path / "good.json", {"temperature": 0.5})
+    write(tmp_path / "bad.json", {"temperature": "hot"})
+    parameters = ParameterLayers()
+    registry = PresetRegistry(parameters, str(tmp_path), poll_interval=0)
+
+    async def run():
+        await registry.start()
+        assert sorted(registry.presets) == ["good.json"]
+        assert registry.search("GO") == ["good.json"]
+        try:
+            registry.get("bad.json")
+        except PresetError as e:
+            assert "'temperature'" in str(e)
+        else:
+            raise AssertionError("invalid preset was returned")
+
+        preset = registry.get("good.json")
+        parameters.set_preset(preset.params, preset.name)
+        version = parameters.preset.version
+        in_flight = parameters.get_request_params(1)
+
+        write(tmp_path / "good.json", {"temperature": 0.9})
+        assert await registry.refresh() == {"good.json"}
+        assert parameters.preset.params["temperature"] == 0.9
+        assert parameters.preset.version == version + 1
+        assert in_flight["temperature"] == 0.5
+
+        # Unchanged files are not read again
+        assert await registry.refresh() == set()
+
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+# tests/test_prompt_prefix.py
+
+import json
+from services.conversation import Conversation
+from services.prompt_prefix import PromptPrefix
+from services.tokenizer import HeuristicTokenEstimator
+
+DIALOGUE = [
+    {"role": "user", "content": "Say \"hi\" \\ wave"},
+    {"role": "assistant", "content": "Héllo 👋\nthere\t!"},
+]
+
+def test_encoded_prefix_matches_messages():
+    prefix = PromptPrefix("test", "You are \"quoted\" ✨", DIALOGUE)
+    suffix = "\nYou are talking to Discord user 'bob\\\"'."
+    assert json.loads(b"[" + prefix.encode(suffix) + b"]") == prefix.messages(suffix)
+    assert prefix.messages(suffix)[0]["content"].endswith(suffix)
+    assert len(prefix) == 3
+
+def test_conversation_encoding_matches_full_messages():
+    estimator = HeuristicTokenEstimator()
+    prefix = PromptPrefix("test", "Persona", DIALOGUE)
+    conversation = Conversation(estimator, prefix=prefix, system_suffix="\nsuffix")
+    conversation.append({"role": "user", "content": "bob: \"what\" ünïcode"})
+    conversation.append({"role": "assistant", "content": "Reply."})
+
+    assert json.loads(b"[" + conversation.encode_messages() + b"]") == conversation.full_messages()
+    assert json.loads(b"[" + conversation.encode_messages(end=-1) + b"]") == conversation.full_messages()[:-1]
+
+def test_token_total_matches_recount():
+    estimator = HeuristicTokenEstimator()
+    prefix = PromptPrefix("test", "Persona", DIALOGUE)
+    conversation = Conversation(estimator, prefix=prefix, system_suffix="\nsuffix")
+    for i in range(6):
+        conversation.append({"role": "user", "content": f"message {i} " * 20})
+    conversation.set_content(-1, "short")
+    conversation.pop()
+    conversation.trim(conversation.total_tokens - 1)
+
+    expected = sum(estimator.count_message(message) for message in conversation.full_messages())
+    assert conversation.total_tokens == expected
@@ -0,0 +1,107 @@
+# tests/test_request_dispatcher.py
+
+import asyncio
+from services.request_dispatcher import RequestDispatcher
+
+def test_run_local_does_not_take_an_upstream_slot():
+    async def run():
+        dispatcher = RequestDispatcher(max_concurrent=1, weights={"channel": 1})
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            return "upstream"
+
+        async def local():
+            return "local"
+
+        # Another user holds the only upstream slot
+        busy = asyncio.create_task(dispatcher.run(1, upstream))
+        await asyncio.sleep(0)
+        result = await asyncio.wait_for(dispatcher.run_local(2, local), 1)
+        release.set()
+        await busy
+        return result, dispatcher.get_metrics()
+
+    result, metrics = asyncio.run(run())
+    assert result == "local"
+    assert metrics["completed"] == 1
+    assert metrics["in_flight"] == 0
+
+def test_run_local_waits_for_the_users_earlier_requests():
+    async def run():
+        dispatcher = RequestDispatcher(max_concurrent=4, weights={"channel": 1})
+        order = []
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            order.append("generation")
+
+        async def local():
+            order.append("local")
+
+        first = asyncio.create_task(dispatcher.run(1, slow))
+        await asyncio.sleep(0)
+        await dispatcher.run_local(1, local)
+        await first
+        return order
+
+    assert asyncio.run(run()) == ["generation", "local"]
+
+def test_waiter_cancelled_during_a_release_is_skipped():
+    async def run():
+        dispatcher = RequestDispatcher(max_concurrent=1, weights={"channel": 1})
+        release = asyncio.Event()
+        waiters = []
+
+        async def holder():
+            await release.wait()
+            # Cancel the next waiter in the same loop step the slot is released
+            waiters[0].cancel()
+            return "first"
+
+        async def waiter(result):
+            return result
+
+        first = asyncio.create_task(dispatcher.run(1, holder))
+        await asyncio.sleep(0)
+        waiters.append(asyncio.create_task(dispatcher.run(2, lambda: waiter("second"))))
+        waiters.append(asyncio.create_task(dispatcher.run(3, lambda: waiter("third"))))
+        await asyncio.sleep(0)
+
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(first, *waiters, return_exceptions=True), 1)
+        return results, dispatcher.get_metrics()
+
+    (first, second, third), metrics = asyncio.run(run())
+    assert first == "first"
+    assert isinstance(second, asyncio.CancelledError)
+    assert third == "third"
+    assert metrics["in_flight"] == 0
+    assert metrics["waiting_for_slot"] == 0
+
+def test_priority_classes_share_slots_by_weight():
+    async def run():
+        dispatcher = RequestDispatcher(max_concurrent=1, weights={"admin": 2, "channel": 1}, user_queue_limit=0)
+        release = asyncio.Event()
+        order = []
+
+        async def holder():
+            await release.wait()
+
+        async def record(name):
+            order.append(name)
+
+        first = asyncio.create_task(dispatcher.run(0, holder))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(dispatcher.run(user_id, lambda name=f"{priority}{user_id}": record(name), priority))
+            for priority, users in (("channel", (1, 2, 3)), ("admin", (4, 5, 6)))
+            for user_id in users
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["admin4", "admin5", "channel1", "admin6", "channel2", "channel3"]
@@ -0,0 +1,27 @@
+# tests/test_response_processor.py
+
+from services.response_processor import paginate, join_continuation, restarts_reply
+
+def test_paginate_breaks_after_sentences():
+    text = "First sentence here. Second one follows! Third?"
+    assert paginate(text, max_length=30) == ["First sentence here.", "Second one follows! Third?"]
+
+def test_paginate_keeps_urls_and_file_names_whole():
+    text = "See https://example.com/page and open config.json for details about it"
+    chunks = paginate(text, max_length=40)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    words = " ".join(chunks).split()
+    assert "https://example.com/page" in words
+    assert "config.json" in words
+    assert " ".join(chunks) == text
+
+def test_continuation_joins_mid_word_and_after_sentences():
+    assert join_continuation("The cat sat on the ma", "t and slept.") == "The cat sat on the mat and slept."
+    assert join_continuation("It was late.", "Then it rained.") == "It was late. Then it rained."
+    assert join_continuation('She said "hi."', "He left.") == 'She said "hi." He left.'
+    assert join_continuation("It was late.", " Then it rained.") == "It was late. Then it rained."
+
+def test_restarted_reply_is_detected():
+    previous = "Once upon a time there was a dragon who lived in a cave."
+    assert restarts_reply(previous, "Once upon a time there was a dragon who lived in a cave by the sea.")
+    assert not restarts_reply(previous, " It guarded a pile of gold.")
@@ -0,0 +1,87 @@
+# tests/test_streaming.py
+
+import asyncio
+import json
+import types
+import cogs.events as events_module
+from cogs.events import StreamingReply
+from services.ai_client import AIClient
+
+class FakeStreamResponse:
+    def __init__(self, *chunks):
+        self.content = self._iterate(chunks)
+
+    async def _iterate(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+def event(content=None, finish_reason=None):
+    delta = {"content": content} if content is not None else {}
+    data = {"choices": [{"delta": delta, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+def read_stream(*chunks):
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    result = asyncio.run(AIClient()._read_stream(FakeStreamResponse(*chunks), on_partial))
+    return result, partials
+
+def test_stream_accumulates_deltas_until_done():
+    result, partials = read_stream(
+        b": keep-alive\n\n", event("Hel"), event("lo"), event(finish_reason="stop"),
+        b"data: [DONE]\n\n", event(" ignored"),
+    )
+    assert partials == ["Hel", "Hello"]
+    assert result["choices"][0]["message"]["content"] == "Hello"
+    assert result["choices"][0]["finish_reason"] == "stop"
+
+def test_stream_joins_lines_split_across_chunks():
+    data = event("Grüße") + event(" aus Köln", finish_reason="length")
+    chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+    result, partials = read_stream(*chunks)
+    assert partials == ["Grüße", "Grüße aus Köln"]
+    assert result["choices"][0]["finish_reason"] == "length"
+
+def test_stream_reads_a_last_line_without_newline():
+    result, _ = read_stream(event("Hi"), event("!")[:-2])
+    assert result["choices"][0]["message"]["content"] == "Hi!"
+
+class FakeReply:
+    def __init__(self, content):
+        self.edits = [content]
+
+    async def edit(self, content, view=None):
+        self.edits.append(content)
+
+class FakeMessage:
+    author = types.SimpleNamespace(id=1)
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, content, view=None):
+        self.replies.append(FakeReply(content))
+        return self.replies[-1]
+
+def test_streaming_edits_are_throttled(monkeypatch):
+    monkeypatch.setattr(events_module, "STREAM_EDIT_INTERVAL", 0.05)
+
+    async def run():
+        message = FakeMessage()
+        streaming_reply = StreamingReply(message)
+        await streaming_reply.update("One")
+        for text in ("One two", "One two three", "One two three four"):
+            await streaming_reply.update(text)
+        await asyncio.sleep(0.1)
+        await streaming_reply.update("One two three four five")
+        reply = await streaming_reply.finish("One two three four five six.")
+        return message, reply
+
+    message, reply = asyncio.run(run())
+    assert len(message.replies) == 1
+    # The first text is posted right away, the updates in between are merged into a
+    # single edit once the interval has passed, and the final text replaces the rest
+    assert reply.edits == ["One …", "One two three four …", "One two three four five six."]
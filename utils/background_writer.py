@@ -0,0 +1,230 @@
+# utils/background_writer.py
+
+import functools
+import os
+import sys
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from config.settings import WRITER_QUEUE_SIZE, WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL, WRITER_FSYNC
+
+class BackgroundWriter:
+    """Performs file writes on a dedicated thread so disk latency never blocks the event loop.
+
+    Writes are queued on a bounded queue and written in batches, opening each file
+    once per batch. ``WRITER_FSYNC`` controls durability: ``never`` leaves flushing
+    to the OS, ``batch`` fsyncs every file touched by a batch.
+
+    Queuing never blocks the caller. When the queue is full, writes are coalesced
+    per file in an overflow buffer, and later writes follow them there so the
+    order is kept, until the writer has emptied the queue and writes the buffer
+    out. Beyond ``max_queue_size`` buffered writes, new ``droppable`` writes are
+    dropped and counted; all other writes are always kept, since a missing line
+    would corrupt a chat log replay.
+    """
+    def __init__(self, max_queue_size=WRITER_QUEUE_SIZE, batch_size=WRITER_BATCH_SIZE,
+                 flush_interval=WRITER_FLUSH_INTERVAL, fsync=WRITER_FSYNC):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.thread = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.overflow = {}  # path -> [mode, data chunks, futures], written once the queue drains
+        self.overflow_writes = 0
+
+        self.peak_queue_depth = 0
+        self.coalesced_writes = 0
+        self.dropped_writes = 0
+        self.batches = 0
+        self.items_written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.last_batch_time = 0.0
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+                self.thread.start()
+
+    def write(self, path, data, mode='a', droppable=False):
+        """Queue ``data`` to be written to ``path``; returns a Future resolved once it is on disk.
+
+        A ``droppable`` write may be discarded when the overflow buffer is full.
+        """
+        future = Future()
+        if self.closed:
+            # Late writes during shutdown go straight to disk
+            try:
+                with open(path, mode, encoding='utf-8') as file:
+                    file.write(data)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_started()
+        with self.lock:
+            if not self.overflow:
+                try:
+                    self.queue.put_nowait((path, data, mode, future))
+                    self.peak_queue_depth = max(self.peak_queue_depth, self.queue.qsize())
+                    return future
+                except queue.Full:
+                    pass
+            self._coalesce(path, data, mode, future, droppable)
+        return future
+
+    def _coalesce(self, path, data, mode, future, droppable):
+        """Buffer a write that didn't fit in the queue; called with the lock held"""
+        if droppable and self.overflow_writes >= self.max_queue_size:
+            self.dropped_writes += 1
+            future.set_exception(queue.Full(f"Background writer overflow, dropped write to {path}"))
+            return
+
+        entry = self.overflow.get(path)
+        if entry is None or mode != 'a':
+            # A full rewrite supersedes whatever was buffered for the file
+            futures = entry[2] if entry is not None else []
+            self.overflow[path] = [mode, [data], futures + [future]]
+        else:
+            entry[1].append(data)
+            entry[2].append(future)
+        self.overflow_writes += 1
+        self.coalesced_writes += 1
+
+    def _take_overflow(self):
+        """Turn the overflow buffer into a batch once the queue is empty"""
+        with self.lock:
+            if not self.overflow or not self.queue.empty():
+                return []
+            overflow, self.overflow = self.overflow, {}
+            self.overflow_writes = 0
+
+        batch = []
+        for path, (mode, chunks, futures) in overflow.items():
+            future = Future()
+            future.add_done_callback(functools.partial(self._resolve_all, futures))
+            batch.append((path, "".join(chunks), mode, future))
+        return batch
+
+    @staticmethod
+    def _resolve_all(futures, done):
+        for future in futures:
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(None)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self._write_overflow()
+                self.queue.task_done()
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    next_item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    stop = True
+                    break
+                batch.append(next_item)
+
+            self._write_batch(batch)
+            # Before marking the batch done, so flush() also waits for the overflow
+            self._write_overflow()
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                self.queue.task_done()
+                return
+
+    def _write_overflow(self):
+        overflow = self._take_overflow()
+        if overflow:
+            self._write_batch(overflow)
+
+    def _write_batch(self, batch):
+        started = time.monotonic()
+        files = {}
+        written = []
+        flush_error = None
+        try:
+            for path, data, mode, future in batch:
+                try:
+                    file = files.get(path)
+                    if file is None or mode != 'a':
+                        if file is not None:
+                            file.close()
+                        file = files[path] = open(path, mode, encoding='utf-8')
+                    file.write(data)
+                    written.append(future)
+                    self.items_written += 1
+                    self.bytes_written += len(data)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Background writer failed to write {path}: {str(e)}", file=sys.stderr)
+                    future.set_exception(e)
+
+            for file in files.values():
+                file.flush()
+                if self.fsync == "batch":
+                    os.fsync(file.fileno())
+        except Exception as e:
+            flush_error = e
+            self.errors += 1
+            print(f"Background writer failed to flush: {str(e)}", file=sys.stderr)
+        finally:
+            for file in files.values():
+                file.close()
+
+        for future in written:
+            if flush_error is not None:
+                future.set_exception(flush_error)
+            else:
+                future.set_result(None)
+        self.batches += 1
+        self.last_batch_time = time.monotonic() - started
+
+    def flush(self):
+        """Block until every queued write has been written"""
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        """Write everything still queued and stop the writer thread"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+
+    def get_metrics(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "peak_queue_depth": self.peak_queue_depth,
+            "coalesced_writes": self.coalesced_writes,
+            "dropped_writes": self.dropped_writes,
+            "batches": self.batches,
+            "items_written": self.items_written,
+            "bytes_written": self.bytes_written,
+            "errors": self.errors,
+            "last_batch_ms": round(self.last_batch_time * 1000, 2),
+        }
+
+# Shared writer used for chat logs, history exports and the log file
+background_writer = BackgroundWriter()
@@ -0,0 +1,66 @@
+# utils/debouncer.py
+
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger('discord')
+
+class Debouncer:
+    """Collects items per key and hands them over together once the key goes quiet.
+
+    ``callback(key, items)`` is awaited when no new item has arrived for ``window``
+    seconds, or once ``max_wait`` seconds have passed since the first item of the
+    burst so a steady trickle can't delay it forever.
+    """
+    def __init__(self, window, callback, max_wait=0.0):
+        self.window = window
+        self.callback = callback
+        self.max_wait = max_wait
+        self.pending = {}  # key -> (time of the first item, items)
+        self.timers = {}  # key -> task waiting for the key to go quiet
+        self.running = set()
+        self.bursts = 0
+        self.items = 0
+
+    def submit(self, key, item):
+        now = time.monotonic()
+        started, items = self.pending.setdefault(key, (now, []))
+        items.append(item)
+        self.items += 1
+
+        timer = self.timers.get(key)
+        if timer is not None:
+            timer.cancel()
+        delay = self.window
+        if self.max_wait:
+            delay = min(delay, max(0.0, started + self.max_wait - now))
+        self.timers[key] = asyncio.create_task(self._fire_after(key, delay))
+
+    async def _fire_after(self, key, delay):
+        await asyncio.sleep(delay)
+
+        # Items arriving from here on start a new burst
+        task = self.timers.pop(key)
+        _, items = self.pending.pop(key)
+        self.bursts += 1
+        self.running.add(task)
+        try:
+            await self.callback(key, items)
+        except Exception as e:
+            logger.error(f"Error handling message burst: {str(e)}", extra={'user_id': 'N/A', 'command': 'debounce'})
+        finally:
+            self.running.discard(task)
+
+    def get_metrics(self):
+        return {
+            "window": self.window,
+            "pending_bursts": len(self.pending),
+            "bursts": self.bursts,
+            "messages": self.items,
+            "coalesced": self.items - self.bursts - sum(len(items) for _, items in self.pending.values()),
+        }
+
+    def close(self):
+        for task in list(self.timers.values()) + list(self.running):
+            task.cancel()
@@ -0,0 +1,23 @@
+# utils/json_codec.py
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast serializer for API request and response bodies, when available
+BACKEND = "orjson" if orjson is not None else "json"
+
+def dumps(obj):
+    """Serialize ``obj`` to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def loads(data):
+    """Deserialize JSON from bytes or str; invalid input raises json.JSONDecodeError"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -2,6 +2,7 @@
 
 import logging
 import json
+from utils.background_writer import background_writer
 
 class CustomFormatter(logging.Formatter):
     def format(self, record):
@@ -29,12 +30,25 @@ class CustomFormatter(logging.Formatter):
         
         return message
 
+class BackgroundFileHandler(logging.Handler):
+    """Log handler that appends records to a file through the background writer"""
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = filename
+
+    def emit(self, record):
+        try:
+            # Log lines are the only writes that may be dropped under overload
+            background_writer.write(self.filename, self.format(record) + '\n', droppable=True)
+        except Exception:
+            self.handleError(record)
+
 def setup_logger():
     logger = logging.getLogger('discord')
     logger.setLevel(logging.INFO)
 
     # Create handlers
-    file_handler = logging.FileHandler(filename='bot.log', encoding='utf-8', mode='a')
+    file_handler = BackgroundFileHandler(filename='bot.log')
     stream_handler = logging.StreamHandler()
 
     # Create and set formatter